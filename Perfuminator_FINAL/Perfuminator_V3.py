@@ -8,17 +8,57 @@ Version 3: Added Validation, formatted for pep8
 '''
 
 # Import modules
+import argparse
 import json
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
 from tkinter import (Tk, Frame, Label, Button, Canvas, Scrollbar, LabelFrame,
-                     PhotoImage, StringVar, Entry, messagebox, NSEW, NS, W,
-                     CENTER)
+                     StringVar, BooleanVar, Entry, Listbox, Scale,
+                     OptionMenu, Checkbutton, messagebox, NSEW, NS, W,
+                     CENTER, END)
+from blend_scoring import (Blend, BlendScorer, profile_lines,
+                           profile_template)
+from catalog_compiler import load_catalog
+from catalog_watcher import CatalogDiff, CatalogWatcher
+from background_writer import BackgroundWriter
+from image_assets import ImageAssets
+from order_store import OrderStore
+from popularity import Popularity
+from scent_catalog import FREE_REIGN
+from scent_neighbours import NeighbourTable
+from scent_search import ScentSearch
+from score_cache import ScoreCache
+from telemetry import Telemetry
+
+# The file the scent notes and palettes are loaded from
+SCENT_DATA_FILE = "scent_data.JSON"
+# How often the scent data file is checked for changes, in milliseconds
+RELOAD_POLL_MS = 1000
+# Most MainGame frames kept for reuse, one per palette. The least recently
+# used one is destroyed when another palette is started.
+MAIN_GAME_CACHE_SIZE = 3
+# Most different scents in one blend, unless --max-blend-size is given
+MAX_BLEND_SIZE = 3
+# How long typing in the scent filter has to pause before the grid is
+# filtered, in milliseconds
+SEARCH_DEBOUNCE_MS = 120
+# Most recent filter results kept by MainGame for narrowing and going back
+SEARCH_CACHE_SIZE = 32
+# The sort menu's choice for keeping the palette's own order
+NO_SORT = "(none)"
 
 
 class FrameManager(Tk):
     """This class serves as the main application window and it controls the
     switching between all frames."""
 
-    def __init__(self):
+    def __init__(self, max_blend_size=MAX_BLEND_SIZE):
+        # Startup is timed until the window first appears
+        self.start_time = time.perf_counter()
+        self.time_to_first_window = None
         super().__init__()
         self.title("Perfuminator")
         self.minsize(850, 575)
@@ -28,15 +68,29 @@ class FrameManager(Tk):
         self.grid_columnconfigure(0, weight=1)
 
         # Initialises dictionaries to store important
-        # Stores data for individual scent notes from the JSON file
-        self.scent_notes_data = {}
         # Stores data for preset scent palettes from the JSON file
         self.palettes_data = {}
-        # Stores the calculated totals of scent attributes to be
-        # passed to the checkout frame
-        self.scent_totals = {}
-        self.selected_scent_names = []
-        self.load_scent_data("scent_data.json")
+        # The blend that was checked out, with its totals, to be shown by
+        # the checkout frame
+        self.blend = None
+        self.max_blend_size = max_blend_size
+        # The scent data as a compact matrix, the scorer that uses it and
+        # every palette's rows in it. All are made once the data is loaded
+        self.catalog = None
+        self.scorer = None
+        self.palette_index = None
+        # Recently scored blends, emptied and given a new version number
+        # whenever the scent data is reloaded
+        self.score_cache = ScoreCache()
+        self.catalog_version = 1
+        # The most similar scents to each scent, worked out at load
+        self.neighbours = None
+        # The index for finding scents by name, made the first time the
+        # scent filter is used
+        self.search_index = None
+        self.load_scent_data(SCENT_DATA_FILE)
+        # Checks the scent data file for changes while the app runs
+        self.watcher = CatalogWatcher(SCENT_DATA_FILE)
 
         # Container frame to hold all the frames in it
         self.container = Frame(self)
@@ -45,40 +99,52 @@ class FrameManager(Tk):
         # Places the container in the main window's grid, fills entire grid
         self.container.grid(row=0, column=0, sticky=NSEW)
 
-        # A dictionary to hold each frame
+        # Loads images once so frames can share them
+        self.assets = ImageAssets(self)
+        # Every disk write goes through one background thread: the
+        # checked out perfumes and telemetry
+        self.writer = BackgroundWriter(self)
+        self.orders = OrderStore(self.writer)
+        self.telemetry = Telemetry(self.writer)
+        # Counts the most popular scents and combinations as orders are
+        # saved
+        self.popularity = Popularity()
+        self.popularity.track(self.orders)
+        # Closing the window saves anything still waiting to be written
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # A dictionary to hold each frame once it has been made
         self.frames = {}
-        # Creates instances of the initial frames and adds them to the
-        # dictionary. self.container is the parent widget for these
-        # frames, and 'self' is the controller.
-        self.frames["MainMenu"] = MainMenu(self.container, self)
-        self.frames["PaletteSelector"] = PaletteSelector(
-            self.container, self)
-        self.frames["Checkout"] = Checkout(self.container, self)
-
-        # MainGame is initialised as None as it will be created based
-        # on free reign or palette choice
-        self.frames["MainGame"] = None
+        # The classes that make each frame. Frames are only made the first
+        # time they are shown, so startup doesn't wait for frames that may
+        # never be used. self.container is the parent widget for these
+        # frames, and 'self' is the controller. MainGame isn't here as it
+        # is created based on free reign or palette choice
+        self.frame_factories = {
+            "MainMenu": MainMenu,
+            "PaletteSelector": PaletteSelector,
+            "Checkout": Checkout,
+        }
+        # MainGame frames already made, by palette, least recently used
+        # first
+        self.main_games = OrderedDict()
 
         # Displays the MainMenu frame first
         self.show_frame("MainMenu")
+        self.bind("<Map>", self.on_first_map)
+        self.after(RELOAD_POLL_MS, self.check_scent_data)
 
-    def load_scent_data(self, filename="scent_data.json"):
-        """Loads scent notes and palettes from a JSON file."""
+    def load_scent_data(self, filename=SCENT_DATA_FILE):
+        """Loads scent notes and palettes from a JSON file, or from its
+        compiled catalog if that is up to date. The attributes the scents
+        are rated on come from the file too."""
         try:
-            with open(filename, 'r') as f:
-                data = json.load(f)
-
-            # Checks if the necessary keys are found in the file
-            if "scent_notes" not in data or "palettes" not in data:
-                messagebox.showerror(
-                    "Data Error",
-                    "JSON data file is missing required 'scent_notes' "
-                    "or 'palettes' keys.")
-                self.destroy()
-                return
-
-            self.scent_notes_data = data.get("scent_notes", {})
-            self.palettes_data = data.get("palettes", {})
+            (self.palettes_data, self.catalog,
+             self.palette_index) = load_catalog(filename)
+            self.scorer = BlendScorer(self.catalog, self.score_cache,
+                                      self.catalog_version)
+            self.neighbours = NeighbourTable.build(self.catalog)
+            self.report_missing_scents()
 
         except FileNotFoundError:
             messagebox.showerror(
@@ -91,40 +157,108 @@ class FrameManager(Tk):
                 "JSON Error",
                 f"The file '{filename}' is not a valid JSON file.")
             self.destroy()
+        except ValueError as error:
+            messagebox.showerror("Data Error", str(error))
+            self.destroy()
+
+    def report_missing_scents(self):
+        """Lists every scent the palettes mention that has no data, all in
+        one message. Those scents are just left out of their palettes."""
+        if self.palette_index.dangling:
+            messagebox.showwarning(
+                "Data Error",
+                self.palette_index.report() + "\nThese scents will not be "
+                "shown. Please double-check the file.")
+
+    def check_scent_data(self):
+        """Reloads the scent data if the file has changed. Open MainGame
+        frames are patched rather than rebuilt, so the scents chosen in
+        them are kept. A file that can't be loaded is reported by the
+        watcher and skipped."""
+        try:
+            reloaded = self.watcher.poll()
+            if reloaded is not None:
+                palettes_data, catalog, palette_index = reloaded
+                diff = CatalogDiff(self.palettes_data, self.catalog,
+                                   palettes_data, catalog)
+                old_dangling = self.palette_index.dangling
+                self.palettes_data, self.catalog = palettes_data, catalog
+                self.palette_index = palette_index
+                self.catalog_version += 1
+                self.score_cache.invalidate()
+                self.scorer = BlendScorer(catalog, self.score_cache,
+                                          self.catalog_version)
+                self.search_index = None
+                # Always updated, as scents can move rows without the diff
+                # seeing a change
+                self.neighbours = self.neighbours.updated(catalog, diff)
+                if diff:
+                    for main_game in self.main_games.values():
+                        main_game.apply_catalog_update(diff)
+                if palette_index.dangling != old_dangling:
+                    self.report_missing_scents()
+        finally:
+            # Always checks again, so one failed reload doesn't stop
+            # the file being watched
+            self.after(RELOAD_POLL_MS, self.check_scent_data)
+
+    def get_search_index(self):
+        """Returns the index of scent names, making it if needed."""
+        if self.search_index is None:
+            self.search_index = ScentSearch(self.catalog.scent_names)
+        return self.search_index
+
+    def on_first_map(self, event):
+        """Records how long it took for the window to first appear."""
+        # Child widgets' <Map> events also reach the window's binding
+        if event.widget is not self:
+            return
+        self.unbind("<Map>")
+        self.time_to_first_window = time.perf_counter() - self.start_time
+        self.telemetry.record(
+            "first_window", ms=round(self.time_to_first_window * 1000))
+
+    def on_close(self):
+        """Closes the app once everything queued has been written."""
+        self.shut_down()
+        self.destroy()
+
+    def shut_down(self):
+        """Writes everything still queued and closes the order store. Safe
+        to call more than once."""
+        self.writer.close()
+        self.orders.close()
 
     def show_frame(self, name):
-        """Display the required frame from the dictionary."""
-        frame = self.frames[name]
+        """Display the required frame from the dictionary, making it first
+        if it hasn't been shown before."""
+        frame = self.frames.get(name)
+        if frame is None:
+            frame = self.frame_factories[name](self.container, self)
+            self.frames[name] = frame
         frame.tkraise()
 
     def start_main_game(self, palette_type):
         """Initialises and displays the MainGame frame with the
-        selected palette."""
-        if palette_type == "free_reign":
-            selected_palette = list(self.scent_notes_data.keys())
+        selected palette. The palettes were all checked when the data was
+        loaded, so any missing scents have already been left out."""
+        # Reuses this palette's 'MainGame' frame if it has one, starting it
+        # with no scents chosen, otherwise makes a new instance with the
+        # selected palette
+        main_game = self.main_games.pop(palette_type, None)
+        if main_game is None:
+            main_game = MainGame(self.container, self, palette_type)
+            main_game.grid(row=0, column=0, sticky=NSEW)
         else:
-            selected_palette = self.palettes_data.get(palette_type, [])
+            main_game.clear_selections()
+            main_game.clear_filter()
+        self.main_games[palette_type] = main_game
 
-        # Check if all scent notes in the palette exist in the main data.
-        try:
-            for scent in selected_palette:
-                if scent not in self.scent_notes_data:
-                    raise KeyError(
-                        f"Scent note '{scent}' from the '{palette_type}' "
-                        "palette is missing data.")
-        except KeyError:
-            messagebox.showerror(
-                "Data Error",
-                "Some data is missing from the chosen palette. "
-                "Please double-check the file.")
-            self.destroy()
-            return
+        # Destroys the least recently used frames so they don't pile up
+        while len(self.main_games) > MAIN_GAME_CACHE_SIZE:
+            self.main_games.popitem(last=False)[1].destroy()
 
-        # Remakes a new instance of the 'MainGame' frame with the
-        # selected palette
-        self.frames["MainGame"] = MainGame(
-            self.container, self, selected_palette)
-        self.frames["MainGame"].grid(row=0, column=0, sticky=NSEW)
+        self.frames["MainGame"] = main_game
         self.show_frame("MainGame")
 
 
@@ -158,7 +292,7 @@ class MainMenu(BaseFrame):
         heading.grid(row=0, column=0, columnspan=2, sticky=NSEW)
 
         # Loads and displays image
-        self.image = PhotoImage(file="perfume.png")
+        self.image = self.controller.assets.get("perfume.png")
         image_label = Label(self, image=self.image)
         image_label.grid(row=1, column=0, pady=10, sticky="NSEW",
                          columnspan=2)
@@ -231,15 +365,27 @@ class MainGame(Frame):
     """Main Game Class, This class is where the user will choose the scents
     for their perfume."""
 
-    def __init__(self, parent, controller, scent_palette):
+    # Height of a scent box without its attribute lines, the height each
+    # attribute line adds, and the gap around each box, in pixels
+    BOX_BASE_HEIGHT = 80
+    ATTRIBUTE_LINE_HEIGHT = 20
+    BOX_GAP = 10
+    # Most attribute totals shown in one column
+    TOTALS_PER_COLUMN = 12
+
+    def __init__(self, parent, controller, palette_type):
         super().__init__(parent)
         self.controller = controller
-        # Stores the list of scents available from their choice
-        self.scent_palette = scent_palette
-        # Defines the attributes for each scent
-        self.attributes = ["fruity", "sweet", "citrus", "woody"]
+        # Stores which palette they chose, and the catalog rows of the
+        # scents available from it
+        self.palette_type = palette_type
+        self.palette_rows = self.controller.palette_index.palette(
+            palette_type)
 
-        self.selected_scents = []
+        # The model of the perfume being made: the chosen scents, how many
+        # parts of each and their totals. The widgets only display it
+        self.blend = Blend(self.controller.catalog,
+                           self.controller.max_blend_size)
 
         # Configures the main grid for this frame
         self.grid_columnconfigure(0, weight=5)
@@ -255,31 +401,86 @@ class MainGame(Frame):
         scents_container = Frame(self)
         scents_container.grid(row=0, column=0, rowspan=3,
                               sticky="NSEW", padx=10, pady=10)
-        scents_container.grid_rowconfigure(0, weight=1)
+        scents_container.grid_rowconfigure(1, weight=1)
         scents_container.grid_columnconfigure(0, weight=1)
 
+        # An entry above the grid that filters the scents by name as the
+        # user types
+        self.filter_var = StringVar()
+        filter_frame = Frame(scents_container)
+        filter_frame.grid(row=0, column=0, columnspan=2, sticky="EW",
+                          pady=(0, 10))
+        filter_frame.grid_columnconfigure(1, weight=1)
+        Label(filter_frame, text="Find a scent:",
+              font=("Verdana", 12)).grid(row=0, column=0, padx=(0, 5))
+        Entry(filter_frame, textvariable=self.filter_var,
+              font=("Verdana", 12)).grid(row=0, column=1, sticky="EW")
+        # Recent filter results by query, and the pending filter callback
+        self.filter_results = OrderedDict()
+        self.filter_job = None
+        # The variable traces, as (variable, trace name) pairs, so destroy
+        # can remove them
+        self.traces = [(self.filter_var, self.filter_var.trace_add(
+            "write", self.schedule_filter))]
+
+        # Sliders to only show scents with an attribute in a range, one
+        # attribute at a time, and a menu to sort the scents by one
+        # attribute. The ranges set for each attribute are all applied
+        self.ranges = {}
+        self.range_attribute = StringVar()
+        range_frame = Frame(filter_frame)
+        range_frame.grid(row=1, column=0, columnspan=2, sticky=W,
+                         pady=(5, 0))
+        Label(range_frame, text="Only show",
+              font=("Verdana", 10)).grid(row=0, column=0)
+        self.range_menu = OptionMenu(range_frame, self.range_attribute, "")
+        self.range_menu.grid(row=0, column=1, padx=5)
+        Label(range_frame, text="from",
+              font=("Verdana", 10)).grid(row=0, column=2)
+        self.low_scale = Scale(range_frame, orient="horizontal", length=100,
+                               command=self.change_range)
+        self.low_scale.grid(row=0, column=3, padx=5)
+        Label(range_frame, text="to",
+              font=("Verdana", 10)).grid(row=0, column=4)
+        self.high_scale = Scale(range_frame, orient="horizontal",
+                                length=100, command=self.change_range)
+        self.high_scale.grid(row=0, column=5, padx=5)
+        self.traces.append((self.range_attribute,
+                            self.range_attribute.trace_add(
+                                "write", self.show_range)))
+
+        self.sort_attribute = StringVar(value=NO_SORT)
+        self.sort_descending = BooleanVar(value=True)
+        sort_frame = Frame(filter_frame)
+        sort_frame.grid(row=2, column=0, columnspan=2, sticky=W,
+                        pady=(5, 0))
+        Label(sort_frame, text="Sort by",
+              font=("Verdana", 10)).grid(row=0, column=0)
+        self.sort_menu = OptionMenu(sort_frame, self.sort_attribute, NO_SORT)
+        self.sort_menu.grid(row=0, column=1, padx=5)
+        Checkbutton(sort_frame, text="Highest first",
+                    variable=self.sort_descending,
+                    command=self.schedule_filter).grid(row=0, column=2)
+        Button(sort_frame, text="Clear filters", font=("Verdana", 10),
+               command=self.clear_filter).grid(row=0, column=3, padx=5)
+        self.traces.append((self.sort_attribute,
+                            self.sort_attribute.trace_add(
+                                "write", self.schedule_filter)))
+
         # Creates a widget, which is necessary for adding a scrollbar
         self.canvas = Canvas(scents_container)
-        self.canvas.grid(row=0, column=0, sticky=NSEW)
+        self.canvas.grid(row=1, column=0, sticky=NSEW)
 
-        # Creates a vertical scrollbar and links it to the canvas
+        # Creates a vertical scrollbar and links it to the canvas. Scrolling
+        # also moves the scent boxes to the scents now in view
         vertical_scrollbar = Scrollbar(
             scents_container, orient="vertical",
-            command=self.canvas.yview)
-        vertical_scrollbar.grid(row=0, column=1, sticky=NS)
-
-        self.scents_grid_frame = Frame(self.canvas)
+            command=self.scroll_scents)
+        vertical_scrollbar.grid(row=1, column=1, sticky=NS)
         self.canvas.configure(yscrollcommand=vertical_scrollbar.set)
 
-        # Creates a window in the canvas to hold the frame
-        self.window_scroll = self.canvas.create_window(
-            (0, 0), window=self.scents_grid_frame, anchor="nw")
-        # Binds configure events on the fame to adjust the scroll region,
-        # and adjust width of inner window
-        self.scents_grid_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(
-                scrollregion=self.canvas.bbox("all")))
+        # Binds configure events on the canvas to resize the scent boxes
+        # and make enough of them to fill it
         self.canvas.bind("<Configure>", self.on_canvas_configure)
 
         self.create_scent_boxes_grid(columns=4)
@@ -290,34 +491,50 @@ class MainGame(Frame):
         selectors_labelframe.grid(
             row=0, column=1, sticky="NSEW", padx=10, pady=10)
         selectors_labelframe.grid_columnconfigure(0, weight=1)
-
-        # List to hold labels
-        self.selected_scent_labels = []
-
-        # Create Labels With Base Text
-        for i in range(3):
-            label = Label(selectors_labelframe,
-                          text=f"Scent {i + 1}: (None)",
-                          font=("Verdana", 12))
-            label.grid(row=i, column=0, sticky="W", pady=2)
-            self.selected_scent_labels.append(label)
+        selectors_labelframe.grid_rowconfigure(0, weight=1)
+
+        # One list with a line per chosen scent, so it suits any blend
+        # size without a label for every possible scent
+        self.selection_list = Listbox(
+            selectors_labelframe, height=5, font=("Verdana", 12),
+            activestyle="none", exportselection=False)
+        self.selection_list.grid(row=0, column=0, columnspan=3,
+                                 sticky=NSEW)
+        selection_scrollbar = Scrollbar(
+            selectors_labelframe, orient="vertical",
+            command=self.selection_list.yview)
+        selection_scrollbar.grid(row=0, column=3, sticky=NS)
+        self.selection_list.configure(yscrollcommand=selection_scrollbar.set)
+
+        # Buttons to change the parts of, or take out, the highlighted scent
+        for column, (text, command) in enumerate([
+                ("+1 part", lambda: self.change_selected_parts(1)),
+                ("-1 part", lambda: self.change_selected_parts(-1)),
+                ("Remove", self.remove_selected_scent)]):
+            Button(selectors_labelframe, text=text, font="Verdana 10",
+                   command=command).grid(row=1, column=column,
+                                         sticky="EW", pady=(5, 0))
+        self.selectors_labelframe = selectors_labelframe
+        self.update_selection_count()
+
+        # Shows the scents most like the last one chosen
+        self.similar_to = None
+        self.similar_label = Label(
+            selectors_labelframe, font=("Verdana", 10), justify="left",
+            anchor=W, wraplength=250)
+        self.similar_label.grid(row=2, column=0, columnspan=4, sticky="EW",
+                                pady=(5, 0))
 
         # A LabelFrame widget to group the totals
-        totals_labelframe = LabelFrame(
+        self.totals_labelframe = LabelFrame(
             self, text="Combined Totals", padx=10, pady=10)
-        totals_labelframe.grid(
+        self.totals_labelframe.grid(
             row=1, column=1, sticky="NSEW", padx=10, pady=10)
-        totals_labelframe.grid_columnconfigure(0, weight=1)
-
-        self.total_labels = {}
+        self.total_labels = []
 
-        # Create Attribute Labels
-        for i, attribute in enumerate(self.attributes):
-            label = Label(totals_labelframe,
-                          text=f"{attribute.capitalize()}: 0",
-                          font=("Verdana", 12))
-            label.grid(row=i, column=0, sticky="w", pady=(2, 2))
-            self.total_labels[attribute] = label
+        # Creates the attribute labels and sizes the scent boxes for the
+        # catalog's attributes
+        self.set_attributes(self.controller.catalog.attributes)
 
         # A frame to hold the buttons and the buttons
         button_frame = Frame(self)
@@ -342,23 +559,144 @@ class MainGame(Frame):
             font="Verdana 12 bold", command=self.go_to_checkout)
         checkout_button.grid(row=0, column=2, sticky="NSEW", padx=(5, 0))
 
+    def set_attributes(self, attributes):
+        """Sets up everything that depends on which attributes the scents
+        are rated on: the text template the scent boxes fill in, their
+        height and a total label for each attribute."""
+        self.attributes = attributes
+        self.attribute_template = profile_template(attributes)
+        self.total_templates = self.attribute_template.split("\n")
+        self.box_height = (self.BOX_BASE_HEIGHT
+                           + self.ATTRIBUTE_LINE_HEIGHT * len(attributes))
+        self.row_height = self.box_height + self.BOX_GAP
+
+        # The totals the labels show at the moment
+        self.shown_totals = np.zeros(len(attributes), dtype=np.int32)
+
+        for label in self.total_labels:
+            label.destroy()
+        self.total_labels = []
+        for i, template in enumerate(self.total_templates):
+            label = Label(self.totals_labelframe, text=template.format(0),
+                          font=("Verdana", 12))
+            column, row = divmod(i, self.TOTALS_PER_COLUMN)
+            label.grid(row=row, column=column, sticky="w", pady=(2, 2),
+                       padx=(0, 10))
+            self.total_labels.append(label)
+
+        # The range and sort menus list the attributes, and any ranges or
+        # sorting are cleared
+        self.ranges = {}
+        for menu, variable, choices in (
+                (self.range_menu, self.range_attribute, attributes),
+                (self.sort_menu, self.sort_attribute, [NO_SORT] + attributes)):
+            menu["menu"].delete(0, END)
+            for choice in choices:
+                menu["menu"].add_command(
+                    label=choice,
+                    command=lambda choice=choice, variable=variable:
+                        variable.set(choice))
+        self.range_attribute.set(attributes[0] if attributes else "")
+        self.sort_attribute.set(NO_SORT)
+
+    def show_range(self, *args):
+        """Sets the sliders to the range chosen for the attribute in the
+        range menu, from its lowest to highest value if none has been."""
+        attribute = self.range_attribute.get()
+        if attribute not in self.controller.catalog.attribute_index:
+            return
+        lowest, highest = self.controller.catalog.attribute_range(attribute)
+        low, high = self.ranges.get(attribute, (lowest, highest))
+        for scale, value in ((self.low_scale, low), (self.high_scale, high)):
+            scale.configure(from_=lowest, to=highest)
+            scale.set(value)
+
+    def change_range(self, value=None):
+        """Stores the sliders' range for the attribute in the range menu.
+        A range covering every value is the same as no range."""
+        attribute = self.range_attribute.get()
+        if attribute not in self.controller.catalog.attribute_index:
+            return
+        low, high = self.low_scale.get(), self.high_scale.get()
+        if (low, high) == self.controller.catalog.attribute_range(attribute):
+            self.ranges.pop(attribute, None)
+        else:
+            self.ranges[attribute] = (low, high)
+        self.schedule_filter()
+
     def select_scent(self, scent_name):
-        """Adds the chosen scent to the list and calls other methods to
-        update."""
-        if len(self.selected_scents) < 3:
-            self.selected_scents.append(scent_name)
-            self.update_selection_display()
-            self.update_totals()
+        """Adds the chosen scent to the blend and calls other methods to
+        update. Choosing a scent that is already in the blend adds another
+        part of it."""
+        if scent_name in self.blend:
+            self.change_parts(self.blend.index(scent_name), 1)
+            self.show_similar(scent_name)
+        elif not self.blend.is_full():
+            self.blend.add(scent_name)
+            self.selection_list.insert(END, self.blend.scent_line(-1))
+            self.selection_list.see(END)
+            self.update_selection_count()
+            self.show_totals()
+            self.show_similar(scent_name)
         else:
             messagebox.showinfo(
                 "Limit Reached",
-                "You can only select a maximum of 3 scents.")
+                "You can only select a maximum of "
+                f"{self.blend.max_size} scents.")
+
+    def change_parts(self, index, amount):
+        """Adds amount parts to the scent at index in the blend, taking it
+        out if that leaves it with none."""
+        if self.blend.parts[index] + amount <= 0:
+            self.remove_scent(index)
+            return
+        self.blend.change_parts(index, amount)
+        self.selection_list.delete(index)
+        self.selection_list.insert(index, self.blend.scent_line(index))
+        self.selection_list.selection_set(index)
+        self.show_totals()
+
+    def remove_scent(self, index):
+        """Takes the scent at index out of the blend."""
+        self.blend.remove(index)
+        self.selection_list.delete(index)
+        self.update_selection_count()
+        self.show_totals()
+
+    def change_selected_parts(self, amount):
+        """Changes the parts of the scent highlighted in the list."""
+        selection = self.selection_list.curselection()
+        if selection:
+            self.change_parts(selection[0], amount)
+
+    def remove_selected_scent(self):
+        """Takes the scent highlighted in the list out of the blend."""
+        selection = self.selection_list.curselection()
+        if selection:
+            self.remove_scent(selection[0])
+
+    def show_similar(self, scent_name):
+        """Lists the scents whose attributes are closest to a scent's, or
+        clears the list if scent_name is None."""
+        self.similar_to = scent_name
+        if scent_name is None:
+            self.similar_label.config(text="")
+            return
+        similar = self.controller.neighbours.similar_names(scent_name)
+        self.similar_label.config(
+            text=f"Similar to {scent_name}: {', '.join(similar)}")
+
+    def update_selection_count(self):
+        """Shows how many scents are chosen out of the most allowed."""
+        self.selectors_labelframe.config(
+            text=f"Selected Scents ({len(self.blend)}/"
+                 f"{self.blend.max_size})")
 
     def update_selection_display(self):
-        """Updates the labels with the chosen scents."""
-        for i, scent_name in enumerate(self.selected_scents):
-            self.selected_scent_labels[i].config(
-                text=f"Scent {i + 1}: {scent_name}")
+        """Fills the list in again with every chosen scent."""
+        self.selection_list.delete(0, END)
+        self.selection_list.insert(END, *self.blend.scent_lines())
+        self.update_selection_count()
 
     def reset_selections(self):
         """Resets the users' selections, emptying the list."""
@@ -366,18 +704,140 @@ class MainGame(Frame):
             "Confirm Reset", "Are you sure you want to reset choices?")
 
         if confirmation:
-            self.selected_scents = []
-            for label in self.selected_scent_labels:
-                index = self.selected_scent_labels.index(label)
-                label.config(text=f"Scent {index + 1}: (None)")
-
-            self.update_totals()
+            self.clear_selections()
+
+    def clear_selections(self):
+        """Empties the list of chosen scents and resets the labels."""
+        self.blend.clear()
+        self.update_selection_display()
+        self.show_totals()
+        self.show_similar(None)
+
+    def apply_catalog_update(self, diff):
+        """Switches to a reloaded catalog. Only the scent boxes in view
+        whose scent has moved or changed are filled in again, and chosen
+        scents are kept unless they were removed."""
+        catalog = self.controller.catalog
+        self.palette_rows = self.controller.palette_index.palette(
+            self.palette_type)
+        self.blend.rescore(catalog, self.controller.scorer)
+        if diff.attributes_changed:
+            self.set_attributes(catalog.attributes)
+        else:
+            # The attribute's lowest and highest values may have changed
+            self.show_range()
+        # The old filter results are for the old catalog's rows
+        self.filter_results.clear()
+        self.display_rows = self.ordered_rows(
+            self.filtered_rows(self.filter_var.get()))
+
+        for scent_box, window in self.box_pool:
+            if scent_box.position is None:
+                continue
+            if scent_box.position < len(self.display_rows):
+                new_row = self.display_rows[scent_box.position]
+                if (catalog.scent_names[new_row] == scent_box.scent_name
+                        and scent_box.scent_name not in diff.changed):
+                    # Same scent with the same values, so only its row
+                    # number needs updating
+                    scent_box.scent_row = new_row
+                    continue
+            # Makes refresh_scent_boxes fill this box in again
+            scent_box.position = None
+
+        if diff.removed:
+            self.update_selection_display()
+        self.show_totals()
+        self.show_similar(self.similar_to if self.similar_to in catalog
+                          else None)
+        self.update_scroll_region()
+        self.refresh_scent_boxes()
+
+    def destroy(self):
+        """Removes the variable traces and any pending filter as well as
+        the widgets. Tk keeps them after the widgets are gone, and they
+        hold on to this frame, so it could never be freed."""
+        for variable, trace in self.traces:
+            variable.trace_remove("write", trace)
+        self.traces = []
+        if self.filter_job is not None:
+            self.after_cancel(self.filter_job)
+            self.filter_job = None
+        super().destroy()
+
+    def schedule_filter(self, *args):
+        """Filters the grid once typing pauses, so a fast typist doesn't
+        make it search on every key press."""
+        if self.filter_job is not None:
+            self.after_cancel(self.filter_job)
+        self.filter_job = self.after(SEARCH_DEBOUNCE_MS, self.apply_filter)
+
+    def filtered_rows(self, query):
+        """The palette's rows whose scent names contain query. A query
+        that extends one searched recently only searches that one's
+        results, and going back to a recent query reuses its results."""
+        query = query.strip().casefold()
+        rows = self.filter_results.get(query)
+        if rows is not None:
+            self.filter_results.move_to_end(query)
+            return rows
+        # The longest recent query inside this one has every match
+        narrower = max((previous for previous in self.filter_results
+                        if previous in query), key=len, default=None)
+        within = (self.palette_rows if narrower is None
+                  else self.filter_results[narrower])
+        rows = self.controller.get_search_index().search(query, within)
+        self.filter_results[query] = rows
+        while len(self.filter_results) > SEARCH_CACHE_SIZE:
+            self.filter_results.popitem(last=False)
+        return rows
+
+    def ordered_rows(self, rows):
+        """Keeps the rows inside every attribute range, then sorts them by
+        the sort menu's attribute. Both work on whole columns of the
+        catalog at once."""
+        catalog = self.controller.catalog
+        rows = catalog.filter_rows(rows, self.ranges)
+        if self.sort_attribute.get() in catalog.attribute_index:
+            rows = catalog.sort_rows(rows, self.sort_attribute.get(),
+                                     self.sort_descending.get())
+        return rows
+
+    def apply_filter(self):
+        """Shows only the scents matching the filter entry and attribute
+        ranges, in the chosen order, reusing the scent boxes already
+        made."""
+        if self.filter_job is not None:
+            self.after_cancel(self.filter_job)
+            self.filter_job = None
+        rows = self.ordered_rows(self.filtered_rows(self.filter_var.get()))
+        if np.array_equal(rows, self.display_rows):
+            return
+        self.display_rows = rows
+        self.canvas.yview_moveto(0)
+        for scent_box, window in self.box_pool:
+            if scent_box.position is not None and (
+                    scent_box.position >= len(rows)
+                    or rows[scent_box.position] != scent_box.scent_row):
+                # Makes refresh_scent_boxes fill this box in again
+                scent_box.position = None
+        self.update_scroll_region()
+        self.refresh_scent_boxes()
+
+    def clear_filter(self):
+        """Empties the filter entry, clears the attribute ranges and
+        sorting, and shows every scent again."""
+        self.filter_var.set("")
+        self.ranges = {}
+        self.sort_attribute.set(NO_SORT)
+        self.show_range()
+        self.apply_filter()
 
     def go_to_checkout(self):
         """This method is linked to the checkout button. It passes the
         totals for the checkout and raises the frame."""
 
-        if not self.selected_scents:
+        if not self.blend:
             messagebox.showerror(
                 "No Scents Selected",
                 "Please select at least one scent before proceeding to "
@@ -390,18 +850,10 @@ class MainGame(Frame):
             "You will not be able to change your chosen scents")
 
         if confirmation:
-            self.update_totals()
-            # Creates a dictionary of the final totals by extracting the value
-            # from each label's text. This way ensures that the totals are
-            # the same as the combined totals shown.
-            totals_to_pass = {
-                attr: int(label.cget("text").split(": ")[1])
-                for attr, label in self.total_labels.items()
-            }
-            # Stores the final totals in the FrameManager to then access
-            # in checkout
-            self.controller.scent_totals = totals_to_pass
-            self.controller.selected_scent_names = self.selected_scents
+            # Hands a copy of the blend, totals and all, to the
+            # FrameManager for checkout to show, so checkout matches what
+            # was shown here without working anything out again
+            self.controller.blend = self.blend.copy()
             self.controller.show_frame("Checkout")
 
     def go_back(self):
@@ -412,85 +864,140 @@ class MainGame(Frame):
             "Are you sure you want to go back? "
             "Your choices will not be saved")
         if confirmation:
-            if self.scent_palette == list(
-                    self.controller.scent_notes_data.keys()):
+            if self.palette_type == FREE_REIGN:
                 self.controller.show_frame("MainMenu")
             else:
                 self.controller.show_frame("PaletteSelector")
 
-    def update_totals(self, event=None):
-        """Adds all the chosen scents' attribute values together."""
-        totals = {attr: 0 for attr in self.attributes}
-
-        # Loop to go through all selected scents
-        for scent_name in self.selected_scents:
-            scent_data = self.controller.scent_notes_data.get(
-                scent_name, {})
-            for attr in self.attributes:
-                totals[attr] += scent_data.get(attr, 0)
-
-        # Loop through all attributes
-        for attr, total in totals.items():
-            self.total_labels[attr].config(
-                text=f"{attr.capitalize()}: {total}")
+    def show_totals(self):
+        """Updates only the total labels whose value has changed from what
+        they show."""
+        totals = self.blend.totals
+        changed = np.flatnonzero(totals != self.shown_totals)
+        for column, value in zip(changed.tolist(), totals[changed].tolist()):
+            self.total_labels[column].config(
+                text=self.total_templates[column].format(value))
+        self.shown_totals = totals.copy()
 
     def on_canvas_configure(self, event):
         """This method is for when the canvas is resized.
-        It updates the width of the scents_grid frame to match the
-        canvas's width so nothing gets cut off."""
-        canvas_width = event.width
-        self.canvas.itemconfigure(self.window_scroll, width=canvas_width)
+        It resizes the scent boxes to fit the canvas's width so nothing
+        gets cut off, and makes sure there are enough boxes to fill its
+        height."""
+        self.box_width = max(
+            (event.width - self.BOX_GAP) // self.columns - self.BOX_GAP, 1)
+        # One spare row, as a partly scrolled canvas shows part of an
+        # extra row
+        visible_rows = math.ceil(event.height / self.row_height) + 1
+        while len(self.box_pool) < visible_rows * self.columns:
+            scent_box = ScentBox(self.canvas, self)
+            window = self.canvas.create_window(
+                0, 0, window=scent_box, anchor="nw", state="hidden")
+            self.box_pool.append((scent_box, window))
+        # Every box has to be placed again for the new width
+        for scent_box, window in self.box_pool:
+            scent_box.position = None
+        self.update_scroll_region()
+        self.refresh_scent_boxes()
+
+    def scroll_scents(self, *args):
+        """Scrolls the canvas, then shows the scents now in view."""
+        self.canvas.yview(*args)
+        self.refresh_scent_boxes()
+
+    def update_scroll_region(self):
+        """Makes the canvas scroll over the height all the scent boxes would
+        take up, even though only the ones in view exist."""
+        rows = math.ceil(len(self.display_rows) / self.columns)
+        self.canvas.configure(scrollregion=(
+            0, 0, self.canvas.winfo_width(),
+            rows * self.row_height + self.BOX_GAP))
 
     def create_scent_boxes_grid(self, columns):
-        """Creates all the boxes for all of the scents."""
-        # Loops through each scent name in the selected palette
-        for i, scent_name in enumerate(self.scent_palette):
-            # Calculates the row and column for the scent box in the grid
-            row_number = i // columns
-            column_number = i % columns
-            # Makes each 'box' its own frame and places it according to its
-            # calculated row and column
-            scent_box = Frame(
-                self.scents_grid_frame, width=150, height=160, padx=5,
-                pady=5, borderwidth=1, relief="solid")
-            scent_box.grid(row=row_number, column=column_number,
-                           sticky="NSEW", padx=5, pady=5)
-            scent_box.grid_propagate(False)  # Prevents Resizing
-            scent_box.grid_columnconfigure(0, weight=1)
-            # Configures the rows inside the scent box to be resizable,
-            # depending on the name and attributes length
-            for j in range(len(self.attributes)):
-                scent_box.grid_rowconfigure(j, weight=1)
-            scent_box.grid_rowconfigure(
-                len(self.attributes) + 1, weight=1)
-
-            scent_name_label = Label(
-                scent_box, text=scent_name, font=("Verdana", 10, "bold"))
-            scent_name_label.grid(row=0, column=0, sticky="EW")
-
-            # Gets attribute data and creates a label, for each one,
-            # displaying its value
-            scent_attributes = self.controller.scent_notes_data.get(
-                scent_name, {})
-            for j, attribute in enumerate(self.attributes):
-                value = scent_attributes.get(attribute)
-                attribute_label = Label(
-                    scent_box, text=f"{attribute.capitalize()}: {value}")
-                attribute_label.grid(row=j + 1, column=0, sticky="W")
-
-            add_button = Button(
-                scent_box, text="Add", bg="red", fg="black",
-                font=("Verdana", 10, "bold"),
-                command=lambda s=scent_name: self.select_scent(s))
-            add_button.grid(
-                row=len(self.attributes) + 1, column=0, sticky="NSEW",
-                pady=(5, 0))
-
-        # Makes the columns and rows of the scents_grid_frame resizable
-        for i in range(columns):
-            self.scents_grid_frame.grid_columnconfigure(i, weight=1,
-                                                        minsize=100)
-            self.scents_grid_frame.grid_rowconfigure(i, weight=1)
+        """Sets up the grid of scent boxes. Only the boxes that fit in the
+        canvas are made, in on_canvas_configure, and they are reused for
+        whichever scents are scrolled into view, so a palette of any size
+        opens and scrolls as fast as a small one."""
+        self.columns = columns
+        self.box_width = 1
+        # The catalog rows of the scents to show, in order
+        self.display_rows = self.palette_rows
+        # The pool of (scent box, canvas window) pairs
+        self.box_pool = []
+
+    def refresh_scent_boxes(self):
+        """Places a box on each scent position in view. Each position
+        always uses the same box from the pool, so scrolling by a row only
+        changes the boxes for the row that came into view."""
+        if not self.box_pool:
+            return
+        first = int(self.canvas.canvasy(0) // self.row_height) * self.columns
+        last = min(first + len(self.box_pool), len(self.display_rows))
+        for position in range(first, first + len(self.box_pool)):
+            scent_box, window = self.box_pool[position % len(self.box_pool)]
+            if position >= last:
+                self.canvas.itemconfigure(window, state="hidden")
+                scent_box.position = None
+            elif scent_box.position != position:
+                scent_box.show(position, self.display_rows[position])
+                row_number, column_number = divmod(position, self.columns)
+                self.canvas.coords(
+                    window,
+                    self.BOX_GAP + column_number * (
+                        self.box_width + self.BOX_GAP),
+                    self.BOX_GAP + row_number * self.row_height)
+                self.canvas.itemconfigure(
+                    window, state="normal", width=self.box_width,
+                    height=self.box_height)
+
+
+class ScentBox(Frame):
+    """A box showing one scent's name and attributes, with a button to add
+    it. MainGame reuses a small pool of these for the scents in view. All
+    the attributes share one label, filled in from MainGame's template, so
+    a box costs the same to make and update however many attributes
+    there are."""
+
+    def __init__(self, parent, game):
+        super().__init__(parent, padx=5, pady=5, borderwidth=1,
+                         relief="solid")
+        self.game = game
+        # The position in the grid, and the catalog row and name of the
+        # scent being shown
+        self.position = None
+        self.scent_row = None
+        self.scent_name = None
+
+        self.grid_propagate(False)  # Prevents Resizing
+        self.grid_columnconfigure(0, weight=1)
+        # The attributes take up any spare height
+        self.grid_rowconfigure(1, weight=1)
+
+        self.name_label = Label(self, font=("Verdana", 10, "bold"))
+        self.name_label.grid(row=0, column=0, sticky="EW")
+
+        # One label with a line for each attribute's value
+        self.attributes_label = Label(self, justify="left")
+        self.attributes_label.grid(row=1, column=0, sticky=W)
+
+        add_button = Button(
+            self, text="Add", bg="red", fg="black",
+            font=("Verdana", 10, "bold"), command=self.add_scent)
+        add_button.grid(row=2, column=0, sticky="NSEW", pady=(5, 0))
+
+    def show(self, position, scent_row):
+        """Fills the box in with the scent from a catalog row."""
+        catalog = self.game.controller.catalog
+        self.position = position
+        self.scent_row = scent_row
+        self.scent_name = catalog.scent_names[scent_row]
+        self.name_label.config(text=self.scent_name)
+        self.attributes_label.config(text=self.game.attribute_template.format(
+            *catalog.matrix[scent_row].tolist()))
+
+    def add_scent(self):
+        """Adds the scent shown in this box to the blend."""
+        self.game.select_scent(self.scent_name)
 
 
 class Checkout(BaseFrame):
@@ -500,13 +1007,16 @@ class Checkout(BaseFrame):
     def __init__(self, parent, controller):
         super().__init__(parent, controller, 7, 2)
         self.perfume_name_var = StringVar()
+        # The last blend saved as an order, so naming it again doesn't
+        # save it twice
+        self.saved_blend = None
 
         heading = Label(
             self, text="Your Created Perfume", font=("Verdana", 24, "bold"))
         heading.grid(row=0, column=0, columnspan=2, pady=(20, 10))
 
         # Loads and displays the image
-        self.image = PhotoImage(file="perfume.png")
+        self.image = self.controller.assets.get("perfume.png")
         image_label = Label(self, image=self.image)
         image_label.grid(row=1, column=0, columnspan=2, pady=10)
 
@@ -570,23 +1080,72 @@ class Checkout(BaseFrame):
         self.final_perfume_label.config(
             text=f"Your Final Scent: {perfume_name}")
 
-        # Finds totals and sets the text to it all on separate lines
-        totals = self.controller.scent_totals
-        totals_list = [
-            f"{key.capitalize()}: {value}"
-            for key, value in totals.items()
-        ]
-        totals_text = "Fragrance Profile: \n" + "\n".join(totals_list)
+        # Saves the order the first time it is named. Saving happens in
+        # the background, so the window doesn't wait for the disk, and
+        # order_saved is called once it is done. The name is locked once
+        # it is saved, so the order always has the name that is shown
+        blend = self.controller.blend
+        if blend is not self.saved_blend:
+            self.saved_blend = blend
+            self.name_entry.config(state="disabled")
+            self.controller.orders.add(
+                perfume_name, blend,
+                lambda order_id, error: self.order_saved(
+                    blend, perfume_name, order_id, error))
+            self.controller.telemetry.record("checkout", scents=len(blend))
+
+        # Shows the checked out blend's totals and scents, each on
+        # separate lines
+        totals_text = ("Fragrance Profile: \n" +
+                       "\n".join(profile_lines(blend.profile())))
         self.final_totals_label.config(text=totals_text)
 
-        # Finds scents and sets the text to it all on separate lines
-        selected_scents = self.controller.selected_scent_names
         selected_scents_text = ("Selected Scents:\n" +
-                                "\n".join(selected_scents))
+                                "\n".join(blend.scent_lines()))
         self.final_selected_scents_label.config(text=selected_scents_text)
 
+    def order_saved(self, blend, perfume_name, order_id, error):
+        """Called once the background writer has saved the order. Shows
+        its order number, or lets the user try again if it failed."""
+        if error is not None:
+            # Naming the perfume again, with the same name or a new one,
+            # will retry the save
+            self.saved_blend = None
+            self.name_entry.config(state="normal")
+            messagebox.showerror(
+                "Order Not Saved",
+                f"Your order couldn't be saved ({error}). Please press "
+                "Enter to try again.")
+            return
+        if blend is self.controller.blend:
+            self.final_perfume_label.config(
+                text=f"Your Final Scent: {perfume_name}\n"
+                     f"Order number {order_id}")
+
+
+def blend_size(text):
+    """Reads the --max-blend-size option, which must be at least 1."""
+    size = int(text)
+    if size < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return size
+
+
+def main(argv=None):
+    """Reads the command line options, then runs the app."""
+    parser = argparse.ArgumentParser(description="Make your own perfume.")
+    parser.add_argument("--max-blend-size", type=blend_size,
+                        default=MAX_BLEND_SIZE,
+                        help="most different scents in one blend "
+                        "(default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    app = FrameManager(args.max_blend_size)
+    app.mainloop()
+    # Makes sure the last orders are saved however the program ends
+    app.shut_down()
+
 
 # Runs and creates an instance of the Framemanager, which controls everything.
 if __name__ == "__main__":
-    app = FrameManager()
-    app.mainloop()
+    main()
@@ -0,0 +1,138 @@
+'''
+Runs the app's disk writes on one background thread, so saving orders or
+telemetry never holds up the window.
+'''
+
+# Import modules
+import queue
+import threading
+import time
+from collections import defaultdict
+from tkinter import TclError
+
+# Most writes waiting at once. Past this, orders wait for space and
+# telemetry is dropped
+QUEUE_SIZE = 1024
+# Most writes handled together in one batch
+BATCH_SIZE = 256
+# How long the writer waits for more writes to join a batch, in seconds
+BATCH_WAIT = 0.05
+# How often finished writes are reported back on the Tk thread, in ms
+RESULT_POLL_MS = 50
+
+
+class BackgroundWriter:
+    """This class queues writes for a background thread. Each kind of
+    write has a handler, registered with register, that is given a whole
+    batch of items at once so it can save them together, e.g. in one
+    database transaction.
+
+    The queue is bounded. submit waits for space when the writer falls
+    behind (back-pressure), unless the write is droppable, in which case
+    it is counted in dropped and skipped. A callback given to submit is
+    run on the Tk thread, through after, with the write's result and the
+    error if it failed. close saves everything still queued before it
+    returns, so nothing submitted is lost when the app exits."""
+
+    def __init__(self, root, queue_size=QUEUE_SIZE):
+        self.root = root
+        self.queue = queue.Queue(queue_size)
+        self.handlers = {}
+        # Finished writes waiting for their callbacks to be run
+        self.results = queue.SimpleQueue()
+        # How many droppable writes were skipped as the queue was full
+        self.dropped = 0
+        # The error from the last batch that failed, if any
+        self.last_error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.poll_job = self.root.after(RESULT_POLL_MS, self.deliver_results)
+
+    def register(self, kind, handler):
+        """Sets the function that writes a batch of one kind of item. It
+        is given a list of items and returns a list of their results."""
+        self.handlers[kind] = handler
+
+    def submit(self, kind, item, callback=None, droppable=False):
+        """Queues an item to be written. Returns False if it was dropped
+        because the queue was full."""
+        if self.closed:
+            raise RuntimeError("The background writer has been closed.")
+        job = (kind, item, callback)
+        if droppable:
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        else:
+            # Waits for the writer to make space, so no order is lost
+            self.queue.put(job)
+        return True
+
+    def run(self):
+        """Runs on the background thread, writing batches until close."""
+        while True:
+            batch = [self.queue.get()]
+            # Gathers any writes that arrive while the batch fills up
+            deadline = time.monotonic() + BATCH_WAIT
+            while batch[-1] is not None and len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get(
+                        timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            jobs_by_kind = defaultdict(list)
+            for job in batch:
+                if job is not None:
+                    jobs_by_kind[job[0]].append(job)
+            for kind, jobs in jobs_by_kind.items():
+                self.write_jobs(kind, jobs)
+            for _ in batch:
+                self.queue.task_done()
+            if batch[-1] is None:
+                return
+
+    def write_jobs(self, kind, jobs):
+        """Writes one kind's jobs from a batch, then queues their
+        callbacks."""
+        try:
+            results = self.handlers[kind]([item for _, item, _ in jobs])
+            error = None
+        except Exception as failure:
+            # Any error is passed back to the callbacks rather than
+            # stopping the writer
+            results = [None] * len(jobs)
+            error = self.last_error = failure
+        for (_, _, callback), result in zip(jobs, results):
+            if callback is not None:
+                self.results.put((callback, result, error))
+
+    def deliver_results(self):
+        """Runs the callbacks of finished writes on the Tk thread."""
+        while True:
+            try:
+                callback, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            callback(result, error)
+        self.poll_job = self.root.after(RESULT_POLL_MS, self.deliver_results)
+
+    def flush(self):
+        """Waits until everything queued has been written."""
+        self.queue.join()
+
+    def close(self):
+        """Writes everything still queued, then stops the thread. Callbacks
+        for the last writes are not run, as the window may be closing."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.root.after_cancel(self.poll_job)
+        except TclError:
+            # The window has already been destroyed
+            pass
+        self.queue.put(None)
+        self.thread.join()
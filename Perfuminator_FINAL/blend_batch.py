@@ -0,0 +1,175 @@
+'''
+Command line batch mode that writes a catalog of every 3 scent blend in each
+palette, with its fragrance profile, using several processes.
+
+Usage: python blend_batch.py [--palettes summer candy] [--free-reign]
+                             [--output-dir blend_catalog] [--workers 4]
+                             [--format csv|jsonl] [--compression gzip|zstd]
+'''
+
+# Import modules
+import argparse
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from blend_export import (COMPRESSION_SUFFIXES, FORMATS, iter_blend_chunks,
+                          open_output, write_chunks, write_header, zstandard)
+from catalog_compiler import load_catalog
+from scent_catalog import FREE_REIGN
+
+# Number of scents in each blend
+BLEND_SIZE = 3
+# Shards per worker, so a slow shard does not leave the other workers idle
+SHARDS_PER_WORKER = 4
+
+# The catalog matrix, scent names and attributes in a worker process, set
+# up once by init_worker rather than sent with every task
+worker_matrix = None
+worker_names = None
+worker_attributes = None
+worker_memory = None
+
+
+def init_worker(memory_name, shape, dtype, scent_names, attributes):
+    """Attaches a worker process to the catalog matrix in shared memory."""
+    global worker_matrix, worker_names, worker_attributes, worker_memory
+    worker_memory = shared_memory.SharedMemory(name=memory_name)
+    worker_matrix = np.ndarray(shape, dtype=dtype, buffer=worker_memory.buf)
+    worker_names = scent_names
+    worker_attributes = attributes
+
+
+def write_shard(rows, first_start, first_end, part_path, fmt, compression):
+    """Writes every blend whose first scent is at position first_start up
+    to first_end of rows to a part file. Returns the number of blends
+    written."""
+    with open_output(part_path, compression) as f:
+        return write_chunks(
+            f, iter_blend_chunks(worker_matrix, rows,
+                                 first_start=first_start,
+                                 first_end=first_end),
+            worker_names, worker_attributes, fmt)
+
+
+def shard_ranges(n, shards):
+    """Splits the first scent positions 0 to n into ranges with about the
+    same number of blends in each."""
+    if n < BLEND_SIZE:
+        return []
+    blends_per_first = np.array(
+        [(n - i - 1) * (n - i - 2) // 2 for i in range(n)], dtype=np.int64)
+    cumulative = np.cumsum(blends_per_first)
+    targets = cumulative[-1] * np.arange(1, shards) / shards
+    cuts = np.unique(np.concatenate(
+        [[0], np.searchsorted(cumulative, targets) + 1, [n]]))
+    return [(int(start), int(end)) for start, end in zip(cuts, cuts[1:])
+            if blends_per_first[start:end].sum()]
+
+
+def write_catalogs(catalog, palettes, output_dir, workers, fmt="csv",
+                   compression=None):
+    """Writes a file of every blend for each palette, sharded across
+    worker processes. Returns the number of blends written per palette.
+
+    Compressed parts are joined as they are, since gzip and zstd both
+    allow a file to be several compressed pieces one after another."""
+    suffix = "." + fmt + COMPRESSION_SUFFIXES.get(compression, "")
+    os.makedirs(output_dir, exist_ok=True)
+    memory = shared_memory.SharedMemory(
+        create=True, size=max(catalog.matrix.nbytes, 1))
+    try:
+        shared_matrix = np.ndarray(catalog.matrix.shape,
+                                   dtype=catalog.matrix.dtype,
+                                   buffer=memory.buf)
+        shared_matrix[:] = catalog.matrix
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=init_worker,
+                initargs=(memory.name, catalog.matrix.shape,
+                          catalog.matrix.dtype.str,
+                          catalog.scent_names,
+                          catalog.attributes)) as executor:
+            # Queues every shard of every palette up front
+            jobs = []
+            for palette_name, rows in palettes.items():
+                parts = []
+                for shard, (start, end) in enumerate(
+                        shard_ranges(len(rows), workers * SHARDS_PER_WORKER)):
+                    part_path = os.path.join(
+                        output_dir, f"{palette_name}.part{shard}")
+                    parts.append((part_path, executor.submit(
+                        write_shard, rows, start, end, part_path, fmt,
+                        compression)))
+                jobs.append((palette_name, parts))
+
+            # Joins the parts onto each palette's file as they finish
+            counts = {}
+            for palette_name, parts in jobs:
+                path = os.path.join(output_dir, palette_name + suffix)
+                counts[palette_name] = 0
+                with open_output(path, compression) as f:
+                    write_header(f, catalog.attributes, fmt)
+                with open(path, "ab") as f:
+                    for part_path, future in parts:
+                        counts[palette_name] += future.result()
+                        with open(part_path, "rb") as part:
+                            shutil.copyfileobj(part, f)
+                        os.remove(part_path)
+        return counts
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def main(argv=None):
+    """Reads the command line options and writes the blend catalogs."""
+    parser = argparse.ArgumentParser(
+        description="Write every 3 scent blend of each palette to a file.")
+    parser.add_argument("--data", default="scent_data.JSON",
+                        help="scent data file (default: %(default)s)")
+    parser.add_argument("--palettes", nargs="+",
+                        help="palettes to write (default: all of them)")
+    parser.add_argument("--free-reign", action="store_true",
+                        help="also write every blend of all the scents")
+    parser.add_argument("--output-dir", default="blend_catalog",
+                        help="folder for the files (default: "
+                        "%(default)s)")
+    parser.add_argument("--format", choices=FORMATS, default="csv",
+                        help="file format (default: %(default)s)")
+    parser.add_argument("--compression", choices=list(COMPRESSION_SUFFIXES),
+                        help="compress the files as they are written")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+    if args.compression == "zstd" and zstandard is None:
+        parser.error("zstd compression needs the zstandard package")
+
+    palettes_data, catalog, palette_index = load_catalog(args.data)
+    if palette_index.dangling:
+        print(palette_index.report() + "\nThese scents are skipped.",
+              file=sys.stderr)
+    palette_names = args.palettes or list(palettes_data)
+    if args.free_reign:
+        palette_names.append(FREE_REIGN)
+    palettes = {}
+    for palette_name in palette_names:
+        if palette_name not in palettes_data and palette_name != FREE_REIGN:
+            parser.error(f"unknown palette {palette_name!r}")
+        rows = palette_index.palette(palette_name)
+        # A scent listed twice in a palette is only used once
+        palettes[palette_name] = rows[np.sort(
+            np.unique(rows, return_index=True)[1])]
+
+    counts = write_catalogs(catalog, palettes, args.output_dir,
+                            max(args.workers, 1), args.format,
+                            args.compression)
+    for palette_name, count in counts.items():
+        print(f"{palette_name}: {count} blends")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+'''
+Streams every 3 scent blend, with its fragrance profile, to a CSV or JSON
+lines file a chunk at a time, so even huge catalogs never have to fit in
+memory.
+'''
+
+# Import modules
+import csv
+import gzip
+import io
+import json
+
+import numpy as np
+
+# zstandard is optional, and only needed for .zst output
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Most blends held in memory at once
+CHUNK_SIZE = 65536
+# File endings for each compression
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+FORMATS = ("csv", "jsonl")
+
+
+def iter_blend_chunks(matrix, rows, chunk_size=CHUNK_SIZE, first_start=0,
+                      first_end=None):
+    """Yields (blends, totals) arrays for every blend of 3 different scents
+    from rows, at most chunk_size blends at a time. Blends are in order of
+    their scents' positions in rows. first_start and first_end limit the
+    blends to those whose first scent is in that range of positions."""
+    rows = np.asarray(rows, dtype=np.intp)
+    n = len(rows)
+    first_end = n if first_end is None else min(first_end, n)
+    pending = []
+    pending_size = 0
+    for i in range(first_start, first_end):
+        j = i + 1
+        while j < n - 1:
+            # Takes as many second scents as fit in one chunk; each second
+            # scent j pairs with every later scent
+            j_end = j + 1
+            count = n - 1 - j
+            while j_end < n - 1 and count + (n - 1 - j_end) <= chunk_size:
+                count += n - 1 - j_end
+                j_end += 1
+            second_positions = np.arange(j, j_end)
+            lengths = n - 1 - second_positions
+            second = np.repeat(second_positions, lengths)
+            third = (np.arange(count) + second + 1
+                     - np.repeat(np.cumsum(lengths) - lengths, lengths))
+            pending.append(np.column_stack(
+                [np.full(count, rows[i]), rows[second], rows[third]]))
+            pending_size += count
+            if pending_size >= chunk_size:
+                yield score_chunk(matrix, np.concatenate(pending))
+                pending = []
+                pending_size = 0
+            j = j_end
+    if pending:
+        yield score_chunk(matrix, np.concatenate(pending))
+
+
+def score_chunk(matrix, blends):
+    """Pairs a chunk of blends with their totals."""
+    return blends, matrix[blends].sum(axis=1, dtype=np.int32)
+
+
+def iter_blend_rows(catalog, rows=None, chunk_size=CHUNK_SIZE):
+    """Yields a (scent names, total, total, ...) tuple for every blend of 3
+    different scents, with the totals in the catalog's attribute order.
+    rows limits the blends to a palette; None uses every scent."""
+    if rows is None:
+        rows = np.arange(len(catalog))
+    names = catalog.scent_names
+    for blends, totals in iter_blend_chunks(catalog.matrix, rows,
+                                            chunk_size):
+        for blend, values in zip(blends.tolist(), totals.tolist()):
+            yield (tuple(names[row] for row in blend), *values)
+
+
+def open_output(path, compression=None):
+    """Opens a text file for writing, compressing it on the fly with
+    "gzip" or "zstd" if asked."""
+    if compression is None:
+        return open(path, "w", newline="", encoding="utf-8")
+    if compression == "gzip":
+        return gzip.open(path, "wt", newline="", encoding="utf-8")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError(
+                "zstd compression needs the zstandard package "
+                "(pip install zstandard).")
+        writer = zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+        return io.TextIOWrapper(writer, newline="", encoding="utf-8")
+    raise ValueError(f"Unknown compression {compression!r}")
+
+
+def write_header(f, attributes, fmt):
+    """Writes the column names, which only CSV files have."""
+    if fmt == "csv":
+        csv.writer(f).writerow(["scent_1", "scent_2", "scent_3", *attributes])
+
+
+def write_chunks(f, chunks, scent_names, attributes, fmt):
+    """Writes chunks of (blends, totals) in the given format, building
+    each chunk's text in memory and writing it in one go. Returns the
+    number of blends written."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}")
+    if fmt == "jsonl":
+        # Quotes each name once, rather than once per blend
+        quoted_names = [json.dumps(name) for name in scent_names]
+        keys = [json.dumps(attr) for attr in attributes]
+    written = 0
+    for blends, totals in chunks:
+        buffer = io.StringIO()
+        if fmt == "csv":
+            csv.writer(buffer).writerows(
+                [scent_names[a], scent_names[b], scent_names[c], *values]
+                for (a, b, c), values in zip(blends.tolist(),
+                                             totals.tolist()))
+        else:
+            buffer.writelines(
+                f'{{"scents": [{quoted_names[a]}, {quoted_names[b]}, '
+                f'{quoted_names[c]}], '
+                + ", ".join(f"{key}: {value}"
+                            for key, value in zip(keys, values))
+                + "}\n"
+                for (a, b, c), values in zip(blends.tolist(),
+                                             totals.tolist()))
+        f.write(buffer.getvalue())
+        written += len(blends)
+    return written
+
+
+def output_format(path):
+    """Works out the format and compression from a file name, e.g.
+    blends.jsonl.gz is JSON lines compressed with gzip."""
+    compression = None
+    for name, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            compression = name
+            path = path[:-len(suffix)]
+    fmt = "jsonl" if path.endswith(".jsonl") else "csv"
+    return fmt, compression
+
+
+def export_blends(path, catalog, rows=None, fmt=None, compression=None,
+                  chunk_size=CHUNK_SIZE):
+    """Writes every blend of the rows (or of every scent) to path. The
+    format and compression default to what the file name ends with.
+    Returns the number of blends written."""
+    path_format, path_compression = output_format(path)
+    fmt = fmt or path_format
+    compression = compression or path_compression
+    if rows is None:
+        rows = np.arange(len(catalog))
+    with open_output(path, compression) as f:
+        write_header(f, catalog.attributes, fmt)
+        return write_chunks(
+            f, iter_blend_chunks(catalog.matrix, rows, chunk_size),
+            catalog.scent_names, catalog.attributes, fmt)
@@ -0,0 +1,176 @@
+'''
+Scores perfume blends without needing a window, so blends can be worked out
+in bulk as well as inside the game.
+'''
+
+# Import modules
+import numpy as np
+
+from score_cache import blend_key
+
+
+class BlendScorer:
+    """This class works out the combined attribute totals of blends. It
+    uses the catalog's scent x attribute matrix, so scoring a blend is just
+    adding rows of the matrix together.
+
+    Given a ScoreCache, each blend's totals are kept in it under the
+    catalog's version, so a blend scored again is just looked up."""
+
+    def __init__(self, catalog, cache=None, version=0):
+        self.catalog = catalog
+        self.attributes = catalog.attributes
+        self.cache = cache
+        # Which load of the scent data the catalog is, for the cache keys
+        self.version = version
+
+    def score_blend(self, scent_names, parts=None):
+        """Returns a dictionary of the totals for one blend of scents.
+        parts gives how many parts of each scent are in the blend; None
+        means one part of each."""
+        return dict(zip(self.attributes,
+                        self.score_vector(scent_names, parts).tolist()))
+
+    def score_vector(self, scent_names, parts=None):
+        """Returns the totals for one blend of scents as an array, in the
+        catalog's attribute order. Each scent's values are weighted by its
+        parts, so the totals are a single matrix-vector product. A cached
+        array is shared, so it is read only."""
+        if self.cache is None:
+            return self.catalog.totals(self.catalog.rows(scent_names), parts)
+        return self.cache.get((self.version, blend_key(scent_names, parts)),
+                              lambda: self.work_out(scent_names, parts))
+
+    def work_out(self, scent_names, parts):
+        """Scores a blend for the cache."""
+        totals = self.catalog.totals(self.catalog.rows(scent_names), parts)
+        totals.flags.writeable = False
+        return totals
+
+    def score_blends(self, blends, parts=None):
+        """Scores many blends in one call. blends is a 2D array of catalog
+        rows (one blend per row, all the same size), or a list of lists of
+        scent names, and parts, if given, is the same shape. Returns an
+        array with one row of totals per blend."""
+        blends = np.asarray(blends)
+        if blends.dtype.kind in "US":
+            blends = np.vectorize(self.catalog.name_index.__getitem__,
+                                  otypes=[np.intp])(blends)
+        return self.catalog.batch_totals(blends, parts)
+
+
+def profile_lines(totals):
+    """Makes the display text for each attribute total,
+    e.g. "Fruity: 3"."""
+    return [f"{attr.capitalize()}: {value}"
+            for attr, value in totals.items()]
+
+
+def profile_template(attributes, separator="\n"):
+    """Makes a format string with a line for each attribute, e.g.
+    "Fruity: {}\nSweet: {}". It is made once per schema, so showing a row
+    of values is a single template.format(*values) call."""
+    return separator.join(
+        attr.capitalize().replace("{", "{{").replace("}", "}}") + ": {}"
+        for attr in attributes)
+
+
+class Blend:
+    """This class is the model of one perfume being made: the chosen
+    scents in order, how many parts of each are in it and their running
+    totals. It is the only place the totals are kept, so the game's labels
+    and checkout just display them and never work them out again."""
+
+    def __init__(self, catalog, max_size=None):
+        self.catalog = catalog
+        # Most different scents allowed, or None for no limit
+        self.max_size = max_size
+        self.scent_names = []
+        self.parts = []
+        self.totals = np.zeros(len(catalog.attributes), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.scent_names)
+
+    def __contains__(self, scent_name):
+        return scent_name in self.scent_names
+
+    def index(self, scent_name):
+        """The position of a scent in the blend."""
+        return self.scent_names.index(scent_name)
+
+    def is_full(self):
+        """Checks if no more different scents can be added."""
+        return self.max_size is not None and len(self) >= self.max_size
+
+    def add(self, scent_name):
+        """Adds one part of a scent that isn't in the blend yet."""
+        if self.is_full():
+            raise ValueError(
+                f"A blend can have at most {self.max_size} scents.")
+        row = self.catalog.name_index[scent_name]
+        self.scent_names.append(scent_name)
+        self.parts.append(1)
+        self.add_values(row, 1)
+
+    def change_parts(self, index, amount):
+        """Adds amount parts (or takes them away if it is negative) to the
+        scent at index. Its parts can't go below one; use remove to take it
+        out."""
+        amount = max(amount, 1 - self.parts[index])
+        self.parts[index] += amount
+        self.add_values(self.catalog.name_index[self.scent_names[index]],
+                        amount)
+
+    def remove(self, index):
+        """Takes the scent at index out of the blend."""
+        row = self.catalog.name_index[self.scent_names.pop(index)]
+        self.add_values(row, -self.parts.pop(index))
+
+    def clear(self):
+        """Empties the blend."""
+        self.scent_names = []
+        self.parts = []
+        self.totals[:] = 0
+
+    def add_values(self, row, parts):
+        """Adds parts of one scent's values to the totals."""
+        self.totals += parts * self.catalog.columns[:, row].astype(np.int32)
+
+    def rescore(self, catalog, scorer=None):
+        """Switches to a reloaded catalog, dropping scents it no longer has
+        and working the totals out again from scratch, with the reloaded
+        catalog's scorer if given."""
+        kept = [i for i, scent_name in enumerate(self.scent_names)
+                if scent_name in catalog]
+        self.catalog = catalog
+        self.scent_names = [self.scent_names[i] for i in kept]
+        self.parts = [self.parts[i] for i in kept]
+        if scorer is None:
+            self.totals = catalog.totals(catalog.rows(self.scent_names),
+                                         self.parts)
+        else:
+            self.totals = scorer.score_vector(self.scent_names,
+                                              self.parts).copy()
+
+    def copy(self):
+        """A separate copy, e.g. to keep the blend that was checked out."""
+        blend = Blend(self.catalog, self.max_size)
+        blend.scent_names = list(self.scent_names)
+        blend.parts = list(self.parts)
+        blend.totals = self.totals.copy()
+        return blend
+
+    def profile(self):
+        """Returns a dictionary of the totals, by attribute."""
+        return dict(zip(self.catalog.attributes, self.totals.tolist()))
+
+    def scent_line(self, index):
+        """The display text for the scent at index, e.g. "Lemon x 2"."""
+        scent_name = self.scent_names[index]
+        parts = self.parts[index]
+        return scent_name if parts == 1 else f"{scent_name} x {parts}"
+
+    def scent_lines(self):
+        """The display text for every scent in the blend."""
+        return [self.scent_line(i) for i in range(len(self))]
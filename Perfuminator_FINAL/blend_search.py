@@ -0,0 +1,656 @@
+'''
+Suggests 3 scent blends whose combined totals are closest to a target
+fragrance profile.
+'''
+
+# Import modules
+import argparse
+import sys
+import time
+import tracemalloc
+from itertools import (combinations, combinations_with_replacement,
+                       islice, product)
+
+import numpy as np
+
+from catalog_compiler import load_catalog
+from scent_catalog import ScentCatalog
+
+# Number of scents in a suggested blend
+BLEND_SIZE = 3
+# Above this many scents suggest_blends switches to the solver, as the
+# exhaustive search's pair table grows with the square of the scents. 300
+# scents take about 55 ms to search exhaustively, 500 about 200-300 ms
+EXHAUSTIVE_LIMIT = 300
+# Default most memory the solver's pair tables may use, in bytes
+SOLVER_MEMORY_LIMIT = 256 * 1024 * 1024
+# Attributes the solver's pair table is indexed by, as well as the total
+KEY_ATTRIBUTES = 2
+# Pairs the solver works on at once, which keeps its temporary arrays small
+CHUNK_PAIRS = 16384
+# Most bytes a pair takes while a pair table is built: its two vector
+# numbers and key, the sort order, and either the sort's own buffer or a
+# reordered copy of one vector number
+BUILD_PAIR_BYTES = 4 + 4 + 8 + 8 + 4
+# Bytes of temporary arrays per pair worked on at once, besides the
+# vectors' attributes
+CHUNK_PAIR_BYTES = 256
+# Vectors whose blends the solver tries before building any pair table
+SEED_VECTORS = 20
+# Most pairs in a block of the solver's pair table per second of its time
+# budget. Sorting a table can't be stopped part way, and takes about a
+# quarter of a second per million pairs, so this keeps it within about a
+# quarter of the budget
+BUDGET_PAIRS_PER_SECOND = 1_000_000
+
+
+def target_vector(catalog, target):
+    """Turns a target profile into an array in the catalog's attribute
+    order. The target can be a dictionary of every attribute or a list of
+    values in attribute order."""
+    if isinstance(target, dict):
+        missing = [attr for attr in catalog.attributes if attr not in target]
+        if missing:
+            raise ValueError(
+                f"Target profile is missing {', '.join(missing)}.")
+        target = [target[attr] for attr in catalog.attributes]
+    target = np.asarray(target, dtype=np.float64)
+    if target.shape != (len(catalog.attributes),):
+        raise ValueError(
+            f"Target profile needs {len(catalog.attributes)} values.")
+    # Every blend's squared distance from the target has to be a finite
+    # number, or the closest can't be told apart
+    largest = np.abs(catalog.matrix).max() if len(catalog) else 0
+    with np.errstate(over="ignore", invalid="ignore"):
+        furthest = ((np.abs(target) + BLEND_SIZE * largest) ** 2).sum()
+    if not np.isfinite(furthest):
+        raise ValueError("Target profile values are too large.")
+    return target
+
+
+def search_rows(catalog, rows):
+    """The sorted, distinct catalog rows to search."""
+    if rows is None:
+        return np.arange(len(catalog))
+    return np.unique(np.asarray(rows, dtype=np.intp))
+
+
+def suggest_blends(catalog, target, rows=None, k=5, method="auto",
+                   memory_limit=SOLVER_MEMORY_LIMIT, time_budget=None):
+    """Returns (results, complete), where results are the k blends of 3
+    different scents closest to the target, best first, as (scent names,
+    totals, distance) tuples. rows limits the search to a palette; None
+    searches every scent (free reign).
+
+    method is "exhaustive", "solver" or "auto", which uses the exhaustive
+    search for up to EXHAUSTIVE_LIMIT scents and the solver above that.
+    memory_limit and time_budget are passed to the solver; if the time
+    budget runs out, the best blends found so far are returned with
+    complete set to False. The exhaustive search always completes."""
+    if method == "auto":
+        method = ("exhaustive"
+                  if len(search_rows(catalog, rows)) <= EXHAUSTIVE_LIMIT
+                  else "solver")
+    if method == "exhaustive":
+        return exhaustive_blends(catalog, target, rows, k), True
+    if method == "solver":
+        return solve_blends(catalog, target, rows, k, memory_limit,
+                            time_budget)
+    raise ValueError(f"Unknown search method {method!r}")
+
+
+def exhaustive_blends(catalog, target, rows=None, k=5):
+    """Tries every blend of 3 different scents. Every pair of scents is
+    added up once. Each scent is then tried as the first of the blend
+    against all later pairs in one array operation, so there is no Python
+    loop over the blends themselves."""
+    target = target_vector(catalog, target)
+    rows = search_rows(catalog, rows)
+    n = len(rows)
+    if n < BLEND_SIZE or k <= 0:
+        return []
+
+    values = catalog.matrix[rows].astype(np.float64)
+    # All pairs (j, l) with j < l, ordered by j, so the pairs that come
+    # after scent i are one slice of the table
+    pair_first, pair_second = np.triu_indices(n, k=1)
+    pair_sums = values[pair_first] + values[pair_second]
+    pair_squares = np.einsum("ij,ij->i", pair_sums, pair_sums)
+    pair_starts = np.searchsorted(pair_first, np.arange(n))
+
+    best_distances = np.empty(0)
+    best_first = np.empty(0, dtype=np.intp)
+    best_pairs = np.empty(0, dtype=np.intp)
+    for i in range(n - 2):
+        start = pair_starts[i + 1]
+        # |pair + scent - target|^2, expanded so the only work per pair is
+        # one dot product
+        residual = values[i] - target
+        distances = (pair_squares[start:] + 2 * (pair_sums[start:] @ residual)
+                     + residual @ residual)
+        if len(distances) > k:
+            keep = np.argpartition(distances, k - 1)[:k]
+        else:
+            keep = np.arange(len(distances))
+        # Merges with the best blends found so far
+        best_distances = np.concatenate([best_distances, distances[keep]])
+        best_first = np.concatenate(
+            [best_first, np.full(len(keep), i, dtype=np.intp)])
+        best_pairs = np.concatenate([best_pairs, start + keep])
+        if len(best_distances) > k:
+            keep = np.argpartition(best_distances, k - 1)[:k]
+            best_distances = best_distances[keep]
+            best_first = best_first[keep]
+            best_pairs = best_pairs[keep]
+
+    # Sorts by distance, then by position so ties come out the same way
+    order = np.lexsort((best_pairs, best_first, best_distances))
+    blends = np.column_stack([
+        rows[best_first[order]],
+        rows[pair_first[best_pairs[order]]],
+        rows[pair_second[best_pairs[order]]]])
+    return blend_results(catalog, blends, best_distances[order])
+
+
+def blend_results(catalog, blends, squared_distances):
+    """Makes the (scent names, totals, distance) tuples for a list of
+    blends of catalog rows."""
+    totals = catalog.batch_totals(blends)
+    distances = np.sqrt(np.maximum(squared_distances, 0))
+    return [
+        (tuple(catalog.scent_names[row] for row in blend),
+         dict(zip(catalog.attributes, blend_totals)),
+         float(distance))
+        for blend, blend_totals, distance in zip(
+            blends.tolist(), totals.tolist(), distances.tolist())]
+
+
+def solve_blends(catalog, target, rows=None, k=5,
+                 memory_limit=SOLVER_MEMORY_LIMIT, time_budget=None):
+    """Finds the exact k closest blends in catalogs far too large to try
+    every blend. Returns (results, complete), where results are the same
+    tuples as suggest_blends. If time_budget (in seconds) runs out first,
+    the best blends found so far are returned with complete set to False.
+    The blends of the vectors nearest a third of the target are tried
+    before anything else, so there are always some to return.
+
+    Scents with identical attributes are interchangeable, so the search
+    runs over the distinct attribute vectors. The sums of all pairs of
+    vectors are indexed by their values of two attributes and their
+    total. Each vector is matched only against the pairs whose values of
+    those two attributes, and whose total, could still beat the k-th best
+    blend found so far. memory_limit (in bytes) caps everything the
+    search works with, including building the pair table; a table too
+    large for it is built and searched in blocks. Whatever the limit, at
+    least one vector's pairs are built at a time.
+
+    How fast this is depends on how many distinct vectors there are and
+    how many attributes. 5,000 scents with 4 attributes rated 0-3 share
+    at most 256 vectors and take about 60 ms. 5,000 distinct vectors need
+    all 12.5 million pairs, about 350 MB to build at once; with 4
+    attributes they take about 6 s in two blocks at the default memory
+    limit, 8 s at 64 MB and 25 s at 16 MB. With 8 or more attributes the
+    closest blends are too far away for the bounds to rule much out:
+    1,500 distinct vectors with 8 attributes take about 10 s, and an
+    exact answer for thousands can take many minutes, so set time_budget
+    for those. The
+    budget is checked while the table is built as well as while it is
+    searched, and is only overrun by sorting one block of it, which
+    BUDGET_PAIRS_PER_SECOND keeps short."""
+    deadline = (None if time_budget is None
+                else time.perf_counter() + time_budget)
+    target = target_vector(catalog, target)
+    rows = search_rows(catalog, rows)
+    if len(rows) < BLEND_SIZE or k <= 0:
+        return [], True
+
+    vectors, groups, counts = np.unique(
+        catalog.matrix[rows], axis=0, return_inverse=True,
+        return_counts=True)
+    groups = groups.reshape(-1)
+    vectors = vectors.astype(np.float64)
+    m, n_attributes = vectors.shape
+
+    # What is left of the memory limit once the arrays for working on
+    # CHUNK_PAIRS pairs at a time are allowed for, in pairs
+    chunk_bytes = CHUNK_PAIRS * (16 * n_attributes + CHUNK_PAIR_BYTES)
+    max_pairs = max(int((memory_limit - chunk_bytes) // BUILD_PAIR_BYTES),
+                    m)
+    if time_budget is not None:
+        max_pairs = max(min(max_pairs,
+                            int(time_budget * BUDGET_PAIRS_PER_SECOND)), m)
+
+    # Tries first vectors roughly best first, so a good threshold is found
+    # early. Each blend is only counted under its lowest vector number, so
+    # the order does not matter for correctness.
+    first_order = np.argsort(
+        ((3 * vectors - target) ** 2).sum(axis=1), kind="stable")
+
+    best = BestBlends(k, counts)
+    seeded = seed_blends(vectors, counts, target,
+                         first_order[:SEED_VECTORS], best)
+    complete = True
+    try:
+        block_start = 0
+        while block_start < m:
+            check_deadline(deadline)
+            # Takes as many second vectors as fit in the memory limit
+            block_end = block_start + 1
+            block_pairs = m - block_start
+            while (block_end < m
+                   and block_pairs + (m - block_end) <= max_pairs):
+                block_pairs += m - block_end
+                block_end += 1
+            table = PairTable(vectors, counts, block_start, block_end,
+                              deadline)
+
+            for a in first_order:
+                if a >= block_end:
+                    continue
+                residual = vectors[a] - target
+                # A blend's squared distance is its pair's squared length,
+                # plus twice the pair's dot product with the residual, plus
+                # the residual's squared length
+                products = vectors @ residual
+                base = residual @ residual
+                for pairs in table.candidate_chunks(residual,
+                                                    best.threshold):
+                    check_deadline(deadline)
+                    second = table.second[pairs]
+                    third = table.third[pairs]
+                    # Only blends where a is the lowest vector, with enough
+                    # scents of that vector to use it more than once, and
+                    # not already tried by seed_blends
+                    uses_of_a = 1 + (second == a) + (third == a)
+                    ok = (second >= a) & (uses_of_a <= counts[a])
+                    if seeded[a]:
+                        ok &= ~(seeded[second] & seeded[third])
+                    second, third = second[ok], third[ok]
+                    distances = (table.squares[pairs][ok]
+                                 + 2 * (products[second] + products[third])
+                                 + base)
+                    best.add(distances, np.full(len(distances), a),
+                             second, third)
+            # Frees this block's table before the next one is built
+            del table
+            block_start = block_end
+    except OutOfTime:
+        complete = False
+
+    # Swaps each best vector blend for the actual scents that make it
+    members = np.split(rows[np.argsort(groups, kind="stable")],
+                       np.cumsum(counts)[:-1])
+    blends = []
+    squared_distances = []
+    for distance, a, b, c in best.sorted():
+        for blend in islice(vector_blends(members, a, b, c),
+                            k - len(blends)):
+            blends.append(blend)
+            squared_distances.append(distance)
+        if len(blends) == k:
+            break
+    return (blend_results(catalog,
+                          np.array(blends, dtype=np.intp).reshape(-1, 3),
+                          np.array(squared_distances)), complete)
+
+
+class OutOfTime(Exception):
+    """Raised inside solve_blends when its time budget runs out."""
+
+
+def check_deadline(deadline):
+    """Raises OutOfTime if the deadline (a perf_counter time) has passed."""
+    if deadline is not None and time.perf_counter() > deadline:
+        raise OutOfTime
+
+
+def chunks(length):
+    """Slices splitting range(length) into CHUNK_PAIRS long pieces."""
+    for start in range(0, length, CHUNK_PAIRS):
+        yield slice(start, min(start + CHUNK_PAIRS, length))
+
+
+def seed_blends(vectors, counts, target, nearest, best):
+    """Tries every blend of the given vectors, the ones nearest a third of
+    the target, so the search starts with a tight threshold and has
+    blends to return even if the time budget runs out while the first
+    pair table is built. Returns which vectors were tried, as the blends
+    made only of them don't need trying again."""
+    nearest = np.sort(nearest)
+    a, b, c = nearest[np.array(
+        list(combinations_with_replacement(range(len(nearest)), 3)),
+        dtype=np.intp).reshape(-1, 3).T]
+    # Only blends with enough scents of a repeated vector
+    ok = np.where(a == c, counts[a] >= 3,
+                  np.where(a == b, counts[a] >= 2,
+                           (b != c) | (counts[b] >= 2)))
+    a, b, c = a[ok], b[ok], c[ok]
+    best.add(((vectors[a] + vectors[b] + vectors[c] - target) ** 2).sum(
+        axis=1), a, b, c)
+    seeded = np.zeros(len(vectors), dtype=bool)
+    seeded[nearest] = True
+    return seeded
+
+
+class PairTable:
+    """The sums of pairs of attribute vectors (b, c) with b <= c, for the
+    b values from start up to end. The attribute values are whole numbers,
+    so the pairs are sorted by their values of the key attributes (the
+    ones with the widest range of sums), then by their total, as one
+    integer key. All the pairs with given key values and a range of
+    totals are then one slice of the table.
+
+    Only each pair's key, its two vector numbers and its sum's squared
+    length are kept, however many attributes there are; the rest of a
+    blend's distance comes from the vectors themselves. The table is built
+    in place where it can be and CHUNK_PAIRS pairs at a time where it
+    can't, so building it takes at most BUILD_PAIR_BYTES a pair. If the
+    deadline passes while it is built, OutOfTime is raised."""
+
+    def __init__(self, vectors, counts, start, end, deadline=None):
+        m, n_attributes = vectors.shape
+        # The lowest and highest sum of each attribute, and of the total
+        lowest = 2 * vectors.min(axis=0)
+        highest = 2 * vectors.max(axis=0)
+        self.key_columns = np.argsort(lowest - highest, kind="stable")[
+            :min(KEY_ATTRIBUTES, n_attributes)]
+        self.rest_columns = np.setdiff1d(np.arange(n_attributes),
+                                         self.key_columns)
+        self.key_lowest = lowest[self.key_columns]
+        self.key_highest = highest[self.key_columns]
+        self.total_lowest = lowest.sum()
+        self.total_highest = highest.sum()
+        # How many values each key attribute and the total can take, as
+        # the place values of the integer key
+        widths = np.append(self.key_highest - self.key_lowest,
+                           self.total_highest - self.total_lowest) + 1
+        self.place_values = np.cumprod(widths[::-1])[::-1] // widths
+        # The key is a sum of place values, so a pair's key is the sum of
+        # each of its vectors' shares of it
+        shares = self.key(2 * vectors[:, self.key_columns],
+                          2 * vectors.sum(axis=1)) // 2
+        # Keys that fit in 16 bits take less memory, and are sorted much
+        # faster by radix sort
+        small_keys = widths.prod() <= 2 ** 16
+
+        # Each b pairs with every c from b to the last vector, or from
+        # b + 1 if no two scents share b
+        firsts = np.arange(start, end) + (counts[start:end] < 2)
+        lengths = m - firsts
+        vector_numbers = np.arange(m, dtype=np.int32)
+        self.second = np.empty(lengths.sum(), dtype=np.int32)
+        self.third = np.empty(lengths.sum(), dtype=np.int32)
+        position = 0
+        for b, first, length in zip(range(start, end), firsts.tolist(),
+                                    lengths.tolist()):
+            self.second[position:position + length] = b
+            self.third[position:position + length] = vector_numbers[first:]
+            position += length
+
+        self.keys = np.empty(len(self.second),
+                             dtype=np.uint16 if small_keys else np.int64)
+        for chunk in chunks(len(self)):
+            check_deadline(deadline)
+            self.keys[chunk] = (shares[self.second[chunk]]
+                                + shares[self.third[chunk]])
+        order = np.argsort(self.keys,
+                           kind="stable" if small_keys else "quicksort")
+        # Sorting the keys in place gives the same as reordering them
+        self.keys.sort()
+        self.second = self.second[order]
+        self.third = self.third[order]
+        del order
+        check_deadline(deadline)
+
+        squares = (vectors ** 2).sum(axis=1)
+        self.squares = np.empty(len(self))
+        for chunk in chunks(len(self)):
+            check_deadline(deadline)
+            second, third = self.second[chunk], self.third[chunk]
+            self.squares[chunk] = (
+                squares[second] + squares[third]
+                + 2 * np.einsum("ij,ij->i", vectors.take(second, axis=0),
+                                vectors.take(third, axis=0)))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def key(self, key_values, totals):
+        """The integer sort key of pairs with the given key attribute
+        values and totals. Only keys within the table's range can be
+        compared with its keys."""
+        offsets = np.column_stack([key_values - self.key_lowest,
+                                   totals - self.total_lowest])
+        return np.rint(offsets @ self.place_values).astype(np.int64)
+
+    def candidate_chunks(self, residual, threshold):
+        """Yields the pairs that could be within threshold (a squared
+        distance) of -residual, i.e. make a blend that close to the target
+        with the vector whose residual this is, as slices or arrays of
+        pair numbers of up to CHUNK_PAIRS pairs each."""
+        ranges = self.candidate_ranges(residual, threshold)
+        if ranges is None:
+            yield from chunks(len(self))
+            return
+        starts, lengths = ranges
+        # Where each slice starts and ends among all the candidates
+        ends = np.cumsum(lengths)
+        begins = ends - lengths
+        for chunk in chunks(int(ends[-1]) if len(ends) else 0):
+            # The parts of the slices in this chunk, joined into one array
+            # of pair numbers
+            first, last = np.searchsorted(ends, [chunk.start, chunk.stop - 1],
+                                          "right")
+            cut_begins = np.maximum(begins[first:last + 1], chunk.start)
+            cut_lengths = (np.minimum(ends[first:last + 1], chunk.stop)
+                           - cut_begins)
+            cut_starts = (starts[first:last + 1] + cut_begins
+                          - begins[first:last + 1])
+            yield (np.arange(chunk.stop - chunk.start)
+                   + np.repeat(cut_starts - np.cumsum(cut_lengths)
+                               + cut_lengths, cut_lengths))
+
+    def candidate_ranges(self, residual, threshold):
+        """The (starts, lengths) of the slices of the table holding the
+        candidate_chunks pairs, or None if every pair is a candidate. Each
+        key attribute's value must be within the square root of the
+        threshold of its wanted value, and what is left of the threshold
+        bounds the total by Cauchy-Schwarz: the squared distance over the
+        other attributes is at least their total difference squared over
+        how many there are."""
+        if not np.isfinite(threshold):
+            return None
+        radius = np.sqrt(threshold) + 1e-9
+        wanted = -residual[self.key_columns]
+        ranges = [np.arange(max(np.ceil(centre - radius), lowest),
+                            min(np.floor(centre + radius), highest) + 1)
+                  for centre, lowest, highest
+                  in zip(wanted, self.key_lowest, self.key_highest)]
+        if (np.prod([len(values) for values in ranges])
+                > min(len(self), CHUNK_PAIRS)):
+            # The bounds rule out too little to be worth working out
+            return None
+        key_values = np.stack(np.meshgrid(*ranges, indexing="ij"),
+                              axis=-1).reshape(-1, len(ranges))
+        left = threshold - ((key_values - wanted) ** 2).sum(axis=1)
+        key_values, left = key_values[left >= 0], left[left >= 0]
+        # The total of the key attributes plus the wanted total of the
+        # others, give or take the bound
+        centres = key_values.sum(axis=1) - residual[self.rest_columns].sum()
+        spread = np.sqrt(left * len(self.rest_columns)) + 1e-9
+        # Kept inside the totals pairs can have, so the search never runs
+        # into the pairs of other key values
+        starts = np.searchsorted(self.keys, self.key(
+            key_values, np.maximum(np.ceil(centres - spread),
+                                   self.total_lowest)).astype(
+                                       self.keys.dtype), "left")
+        ends = np.searchsorted(self.keys, self.key(
+            key_values, np.minimum(np.floor(centres + spread),
+                                   self.total_highest)).astype(
+                                       self.keys.dtype), "right")
+        return starts, np.maximum(ends - starts, 0)
+
+
+class BestBlends:
+    """Keeps the closest vector blends found so far. As one vector blend
+    can stand for many actual blends, it only keeps enough of them to make
+    up k actual blends, which keeps the threshold as tight as possible."""
+
+    def __init__(self, k, counts):
+        self.k = k
+        self.counts = counts
+        self.distances = np.empty(0)
+        self.blends = np.empty((0, 3), dtype=np.intp)
+        self.threshold = np.inf
+
+    def add(self, distances, a, b, c):
+        """Merges new vector blends in and updates the threshold."""
+        if not len(distances):
+            return
+        if np.isfinite(self.threshold):
+            close = distances <= self.threshold
+            distances, a, b, c = distances[close], a[close], b[close], c[close]
+        if len(distances) > self.k:
+            keep = np.argpartition(distances, self.k - 1)[:self.k]
+            distances, a, b, c = distances[keep], a[keep], b[keep], c[keep]
+        distances = np.concatenate([self.distances, distances])
+        blends = np.concatenate([self.blends, np.column_stack([a, b, c])])
+        order = np.lexsort((blends[:, 2], blends[:, 1], blends[:, 0],
+                            distances))
+        distances, blends = distances[order], blends[order]
+        enough = np.searchsorted(
+            np.cumsum(self.blend_counts(blends)), self.k)
+        if enough < len(distances):
+            distances = distances[:enough + 1]
+            blends = blends[:enough + 1]
+            self.threshold = distances[-1]
+        self.distances, self.blends = distances, blends
+
+    def blend_counts(self, blends):
+        """How many actual blends each vector blend stands for."""
+        a, b, c = blends.T
+        n_a, n_b, n_c = (self.counts[a], self.counts[b], self.counts[c])
+        return np.where(
+            a == c, n_a * (n_a - 1) * (n_a - 2) // 6,
+            np.where(a == b, n_a * (n_a - 1) // 2 * n_c,
+                     np.where(b == c, n_a * (n_b * (n_b - 1) // 2),
+                              n_a * n_b * n_c)))
+
+    def sorted(self):
+        """The kept vector blends, best first."""
+        return zip(self.distances.tolist(), *self.blends.T.tolist())
+
+
+def vector_blends(members, a, b, c):
+    """Yields the actual blends of catalog rows for vectors a <= b <= c,
+    where members holds the rows that share each vector."""
+    if a == c:
+        yield from combinations(members[a], 3)
+    elif a == b:
+        for first, second in combinations(members[a], 2):
+            for third in members[c]:
+                yield first, second, third
+    elif b == c:
+        for first in members[a]:
+            for second, third in combinations(members[b], 2):
+                yield first, second, third
+    else:
+        yield from product(members[a], members[b], members[c])
+
+
+def check_solver(trials=300, seed=0):
+    """Checks solve_blends against exhaustive_blends on random catalogs,
+    including ones with repeated vectors and with pair tables split into
+    blocks. Every tenth catalog is large enough for its pairs to be worked
+    on in chunks, and the most memory tracemalloc saw the solver use is
+    checked against its memory limit. Returns the number of trials that
+    failed."""
+    rng = np.random.default_rng(seed)
+    failures = 0
+    for trial in range(trials):
+        large = trial % 10 == 9
+        if large:
+            n = int(rng.integers(300, 700))
+            n_attributes = int(rng.integers(2, 9))
+            values = rng.integers(0, 10, (n, n_attributes))
+            memory_limit = int(rng.choice([8, 32])) * 1024 * 1024
+        else:
+            n = int(rng.integers(BLEND_SIZE, 60))
+            n_attributes = int(rng.integers(1, 6))
+            # Few values, so many scents share a vector
+            values = rng.integers(0, rng.integers(1, 8), (n, n_attributes))
+            memory_limit = int(rng.choice([1_000, 100_000,
+                                           SOLVER_MEMORY_LIMIT]))
+        catalog = ScentCatalog([f"Scent {row}" for row in range(n)],
+                               [f"attribute {column}"
+                                for column in range(n_attributes)],
+                               values.astype(np.int16))
+        target = rng.uniform(0, 3 * values.max() + 1, n_attributes)
+        k = int(rng.integers(1, 12))
+        expected = exhaustive_blends(catalog, target, None, k)
+        if large:
+            tracemalloc.start()
+        found, complete = solve_blends(catalog, target, None, k,
+                                       memory_limit)
+        if large:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if peak > memory_limit:
+                failures += 1
+                print(f"Trial {trial}: the solver used {peak} bytes, over "
+                      f"its memory_limit of {memory_limit} ({n} scents, "
+                      f"{n_attributes} attributes)")
+                continue
+        if (not complete or len(found) != len(expected)
+                or not np.allclose([distance for _, _, distance in found],
+                                   [distance for _, _, distance
+                                    in expected])
+                or any(len(set(names)) != BLEND_SIZE
+                       for names, _, _ in found)):
+            failures += 1
+            print(f"Trial {trial}: the solver disagrees with the "
+                  f"exhaustive search ({n} scents, {n_attributes} "
+                  f"attributes, k={k}, memory_limit={memory_limit})")
+    return failures
+
+
+def main(argv=None):
+    """Suggests blends for a target from the command line, or checks the
+    solver."""
+    parser = argparse.ArgumentParser(
+        description="Suggest 3 scent blends closest to a target profile.")
+    parser.add_argument("--data", default="scent_data.JSON",
+                        help="scent data file (default: %(default)s)")
+    parser.add_argument("--target", type=float, nargs="+",
+                        help="target totals, in the file's attribute order")
+    parser.add_argument("--palette",
+                        help="palette to choose from (default: every scent)")
+    parser.add_argument("-k", type=int, default=5,
+                        help="blends to suggest (default: %(default)s)")
+    parser.add_argument("--method", default="auto",
+                        choices=["auto", "exhaustive", "solver"],
+                        help="search method (default: %(default)s)")
+    parser.add_argument("--check", type=int, metavar="TRIALS",
+                        help="check the solver against the exhaustive "
+                        "search on random catalogs instead")
+    args = parser.parse_args(argv)
+
+    if args.check is not None:
+        failures = check_solver(args.check)
+        print(f"{args.check - failures} of {args.check} trials agreed.")
+        if failures:
+            sys.exit(1)
+        return
+    if args.target is None:
+        parser.error("--target or --check is needed")
+    palettes_data, catalog, palette_index = load_catalog(args.data)
+    rows = None if args.palette is None else palette_index.palette(
+        args.palette)
+    results, _ = suggest_blends(catalog, args.target, rows, args.k,
+                                args.method)
+    for names, totals, distance in results:
+        print(f"{', '.join(names)}: {totals} (distance {distance:.2f})")
+
+
+if __name__ == "__main__":
+    main()
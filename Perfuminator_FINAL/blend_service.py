@@ -0,0 +1,526 @@
+'''
+A local HTTP service that scores blends and suggests scents with the same
+catalog and scoring as the game, so the web shop can use them. It needs no
+window and does not import tkinter.
+
+Usage: python blend_service.py [--data scent_data.JSON] [--host 127.0.0.1]
+                               [--port 8080] [--cache-size 4096]
+                               [--cache-ttl SECONDS] [--time-budget 2]
+                               [--memory-limit 256]
+
+Endpoints, all answered with JSON:
+    GET /palettes
+        Every palette's scents, and the attributes they are rated on.
+    GET /score?scent=Lemon&scent=Pine[&parts=2&parts=1]
+    POST /score with {"scents": ["Lemon", "Pine"], "parts": [2, 1]}
+        A blend's totals. parts is optional and defaults to one of each.
+    GET /suggest?target=6&target=4&target=3&target=2[&palette=summer]
+                [&limit=5]
+    POST /suggest with {"target": {"fruity": 6, ...}, "palette": ...,
+                        "limit": ...}
+        The blends of 3 scents whose totals are closest to a target
+        profile, best first. A GET gives the target in attribute order.
+    GET /similar?scent=Lemon[&scent=Pine][&palette=summer][&limit=5]
+    POST /similar with {"scents": [...], "palette": ..., "limit": ...}
+        The scents most similar to those in a blend, nearest first, with
+        the blend's totals if each were added.
+    GET /stats
+        How many requests have been answered, and how often the score
+        cache had the answer.
+'''
+
+# Import modules
+import argparse
+import asyncio
+import json
+import sys
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from blend_scoring import BlendScorer
+from blend_search import SOLVER_MEMORY_LIMIT, suggest_blends, target_vector
+from catalog_compiler import load_catalog
+from catalog_watcher import CatalogDiff, CatalogWatcher
+from scent_catalog import FREE_REIGN
+from scent_neighbours import NO_NEIGHBOUR, NeighbourTable
+from score_cache import SCORE_CACHE_SIZE, ScoreCache, blend_key
+
+SCENT_DATA_FILE = "scent_data.JSON"
+HOST = "127.0.0.1"
+PORT = 8080
+# How often the scent data file is checked for changes, in seconds
+RELOAD_POLL_SECONDS = 1.0
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 64 * 1024
+# Most header lines accepted in one request
+MAX_HEADERS = 100
+# Suggestions given when the request doesn't say, and the most allowed
+SUGGESTIONS = 5
+MAX_SUGGESTIONS = 50
+# Longest the blend solver may search for one /suggest, in seconds.
+# Palettes small enough to search exhaustively always finish well within it
+SUGGEST_TIME_BUDGET = 2.0
+
+
+class RequestError(Exception):
+    """A request that can't be answered, with the HTTP status to send."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def read_only(*arrays):
+    """Stops the arrays being changed, so they can be shared."""
+    for array in arrays:
+        array.flags.writeable = False
+
+
+def is_number(value):
+    """Checks a value from a request is a finite number, and not a bool."""
+    return type(value) in (int, float) and bool(np.isfinite(value))
+
+
+class CatalogSnapshot:
+    """One loaded version of the scent data, with its scorer, neighbour
+    table and the /palettes answer worked out once. Its arrays are made
+    read only, so every request shares it without copying or locking,
+    including blend searches on worker threads. A reload makes a new
+    snapshot and swaps it in whole; a request keeps using the one it
+    started with.
+
+    Scores and similar scents are kept in the service's ScoreCache, if
+    given, under the snapshot's version, so a repeated blend is just
+    looked up."""
+
+    def __init__(self, version, palettes_data, catalog, palette_index,
+                 neighbours, cache=None):
+        self.version = version
+        self.palettes_data = palettes_data
+        self.catalog = catalog
+        self.palette_index = palette_index
+        self.neighbours = neighbours
+        self.cache = cache
+        self.scorer = BlendScorer(catalog, cache, version)
+        read_only(catalog.columns, catalog.matrix, neighbours.neighbours,
+                  neighbours.distances, palette_index.all_rows,
+                  *palette_index.rows.values())
+        names = catalog.scent_names
+        self.palettes_body = encode({
+            "version": version,
+            "attributes": catalog.attributes,
+            "palettes": {name: [names[row] for row in rows.tolist()]
+                         for name, rows in palette_index.rows.items()},
+            "dangling": palette_index.dangling})
+
+    @classmethod
+    def load(cls, json_path, cache=None):
+        """Loads the first snapshot of a scent data file."""
+        palettes_data, catalog, palette_index = load_catalog(json_path)
+        return cls(1, palettes_data, catalog, palette_index,
+                   NeighbourTable.build(catalog), cache)
+
+    def reloaded(self, palettes_data, catalog, palette_index):
+        """Makes the next snapshot from reloaded data. The neighbour table
+        is updated rather than built again, and the cache is emptied."""
+        diff = CatalogDiff(self.palettes_data, self.catalog, palettes_data,
+                           catalog)
+        snapshot = CatalogSnapshot(self.version + 1, palettes_data, catalog,
+                                   palette_index,
+                                   self.neighbours.updated(catalog, diff),
+                                   self.cache)
+        if self.cache is not None:
+            self.cache.invalidate()
+        return snapshot
+
+    def blend_rows(self, scent_names, parts):
+        """Checks a blend from a request, returning its rows and parts."""
+        if (not isinstance(scent_names, list) or not scent_names
+                or not all(isinstance(name, str) for name in scent_names)):
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               "Give the blend's scents as a list of names.")
+        if len(set(scent_names)) != len(scent_names):
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               "A scent can only be listed once; use parts "
+                               "for more of it.")
+        try:
+            rows = self.catalog.rows(scent_names)
+        except KeyError as error:
+            raise RequestError(HTTPStatus.NOT_FOUND, error.args[0]) from None
+        if parts is not None:
+            if (not isinstance(parts, list) or len(parts) != len(rows)
+                    or not all(type(part) is int and part >= 1
+                               for part in parts)):
+                raise RequestError(HTTPStatus.BAD_REQUEST,
+                                   "Give one whole number of parts, 1 or "
+                                   "more, for each scent.")
+        return rows, parts
+
+    def palette_name(self, palette):
+        """Checks a palette from a request. None means free reign."""
+        if palette is None:
+            return FREE_REIGN
+        if not isinstance(palette, str):
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               "palette must be a palette name.")
+        if palette != FREE_REIGN and palette not in self.palette_index.rows:
+            raise RequestError(HTTPStatus.NOT_FOUND,
+                               f"Unknown palette {palette!r}")
+        return palette
+
+    def target(self, target):
+        """Checks a target profile from a request: a list of values in
+        attribute order, or an object of values by attribute name."""
+        values = target.values() if isinstance(target, dict) else target
+        if (not isinstance(target, (dict, list))
+                or not all(is_number(value) for value in values)):
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               "Give the target as a list of numbers, or an "
+                               "object of numbers by attribute.")
+        try:
+            return target_vector(self.catalog, target)
+        except ValueError as error:
+            raise RequestError(HTTPStatus.BAD_REQUEST, str(error)) from None
+
+    def score(self, scent_names, parts=None):
+        """The /score answer for a blend."""
+        rows, parts = self.blend_rows(scent_names, parts)
+        return {"version": self.version,
+                "scents": scent_names,
+                "parts": parts or [1] * len(rows),
+                "totals": self.scorer.score_blend(scent_names, parts)}
+
+    def suggestions(self, target, palette, limit,
+                    memory_limit=SOLVER_MEMORY_LIMIT, time_budget=None):
+        """Finds the blends closest to a target for /suggest. Also returns
+        whether the search finished, or was cut short by time_budget."""
+        blends, complete = suggest_blends(
+            self.catalog, target, self.palette_index.palette(palette),
+            limit, memory_limit=memory_limit, time_budget=time_budget)
+        return [{"scents": list(names), "totals": totals,
+                 "distance": distance}
+                for names, totals, distance in blends], complete
+
+    def similar(self, scent_names, palette=None, limit=SUGGESTIONS):
+        """The /similar answer for a blend: the scents most similar to any
+        scent in it, nearest first, that aren't already in it. A palette
+        keeps only its own scents. Each comes with the blend's totals if
+        one part of it were added."""
+        rows, _ = self.blend_rows(scent_names, None)
+        palette = self.palette_name(palette)
+        limit = check_limit(limit)
+
+        if self.cache is None:
+            similar = self.similar_scents(rows, palette, limit)
+        else:
+            similar = self.cache.get(
+                (self.version, "similar", blend_key(scent_names), palette,
+                 limit),
+                lambda: self.similar_scents(rows, palette, limit))
+        return {"version": self.version,
+                "scents": scent_names,
+                "similar": similar}
+
+    def similar_scents(self, rows, palette, limit):
+        """Works out the similar scents for a blend's rows."""
+        # Each similar scent's distance to the closest scent in the blend
+        neighbours = self.neighbours.neighbours[rows].ravel()
+        distances = self.neighbours.distances[rows].ravel()
+        keep = ((neighbours != NO_NEIGHBOUR)
+                & ~np.isin(neighbours, rows)
+                & np.isin(neighbours, self.palette_index.palette(palette)))
+        neighbours, distances = neighbours[keep], distances[keep]
+        order = np.lexsort((neighbours, distances))
+        neighbours = neighbours[order]
+        _, first = np.unique(neighbours, return_index=True)
+        suggested = neighbours[np.sort(first)][:limit]
+
+        totals = self.catalog.totals(rows)
+        added = totals + self.catalog.matrix[suggested].astype(np.int32)
+        names = self.catalog.scent_names
+        attributes = self.catalog.attributes
+        return [{"scent": names[row],
+                 "totals": dict(zip(attributes, row_totals))}
+                for row, row_totals in zip(suggested.tolist(),
+                                           added.tolist())]
+
+
+def check_limit(limit):
+    """Checks how many suggestions a request asked for."""
+    if type(limit) is not int or not 0 <= limit <= MAX_SUGGESTIONS:
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           f"limit must be a whole number from 0 to "
+                           f"{MAX_SUGGESTIONS}.")
+    return limit
+
+
+def encode(answer):
+    """Turns an answer into a compact JSON body. NaN and infinity aren't
+    JSON, so they raise ValueError rather than being sent."""
+    return json.dumps(answer, separators=(",", ":"),
+                      allow_nan=False).encode("utf-8")
+
+
+def response(status, body, keep_alive):
+    """Makes the bytes of an HTTP response with a JSON body."""
+    return (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"\r\n").encode("latin-1") + body
+
+
+def request_fields(method, query, body):
+    """Reads a request's fields, from the query string of a GET or the
+    JSON body of a POST. Query fields that can be given more than once
+    come back as lists."""
+    if method == "GET":
+        fields = parse_qs(query)
+        try:
+            return {
+                "scents": fields.get("scent"),
+                "parts": ([int(part) for part in fields["parts"]]
+                          if "parts" in fields else None),
+                "target": ([float(value) for value in fields["target"]]
+                           if "target" in fields else None),
+                "palette": fields.get("palette", [None])[-1],
+                "limit": int(fields.get("limit", [SUGGESTIONS])[-1])}
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               "parts and limit must be whole numbers, and "
+                               "target must be numbers.") from None
+    try:
+        fields = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           "The body must be JSON.") from None
+    if not isinstance(fields, dict):
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           "The body must be a JSON object.")
+    return {"scents": fields.get("scents"),
+            "parts": fields.get("parts"),
+            "target": fields.get("target"),
+            "palette": fields.get("palette"),
+            "limit": fields.get("limit", SUGGESTIONS)}
+
+
+class BlendService:
+    """This class answers the HTTP requests. Everything runs on one
+    asyncio event loop, and working out an answer only reads the current
+    CatalogSnapshot, so no request waits on another. A /suggest search
+    can take far longer than the rest, so it runs on a worker thread,
+    giving the solver time_budget seconds and memory_limit bytes for its
+    pair table. Connections are kept open between requests unless the
+    client asks otherwise."""
+
+    def __init__(self, json_path=SCENT_DATA_FILE, cache=None,
+                 time_budget=SUGGEST_TIME_BUDGET,
+                 memory_limit=SOLVER_MEMORY_LIMIT):
+        self.json_path = json_path
+        self.cache = ScoreCache() if cache is None else cache
+        self.time_budget = time_budget
+        self.memory_limit = memory_limit
+        self.snapshot = CatalogSnapshot.load(json_path, self.cache)
+        self.watcher = CatalogWatcher(json_path)
+        self.requests = 0
+
+    async def answer(self, method, target, body):
+        """Works out the status and body for one request."""
+        url = urlsplit(target)
+        snapshot = self.snapshot
+        if url.path == "/palettes":
+            if method != "GET":
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED,
+                                   "/palettes only takes GET.")
+            return HTTPStatus.OK, snapshot.palettes_body
+        if url.path == "/stats":
+            return HTTPStatus.OK, encode({"version": snapshot.version,
+                                          "requests": self.requests,
+                                          "cache": self.cache.stats()})
+        if url.path not in ("/score", "/suggest", "/similar"):
+            raise RequestError(HTTPStatus.NOT_FOUND,
+                               f"Unknown path {url.path!r}")
+        if method not in ("GET", "POST"):
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED,
+                               f"{url.path} takes GET or POST.")
+        fields = request_fields(method, url.query, body)
+        if url.path == "/score":
+            answer = snapshot.score(fields["scents"], fields["parts"])
+        elif url.path == "/similar":
+            answer = snapshot.similar(fields["scents"], fields["palette"],
+                                      fields["limit"])
+        else:
+            answer = await self.suggest(snapshot, fields)
+        return HTTPStatus.OK, encode(answer)
+
+    async def suggest(self, snapshot, fields):
+        """The /suggest answer. The search runs on a worker thread so other
+        requests keep being answered. Finished searches are cached; one
+        that may have been cut short by the time budget is not."""
+        target = snapshot.target(fields["target"])
+        palette = snapshot.palette_name(fields["palette"])
+        limit = check_limit(fields["limit"])
+
+        key = (snapshot.version, "suggest", tuple(target.tolist()), palette,
+               limit)
+        suggestions, complete = self.cache.lookup(key), True
+        if suggestions is None:
+            suggestions, complete = await asyncio.to_thread(
+                snapshot.suggestions, target, palette, limit,
+                self.memory_limit, self.time_budget)
+            if complete:
+                self.cache.store(key, suggestions)
+        return {"version": snapshot.version,
+                "target": dict(zip(snapshot.catalog.attributes,
+                                   target.tolist())),
+                "palette": palette,
+                "complete": complete,
+                "suggestions": suggestions}
+
+    async def handle_connection(self, reader, writer):
+        """Answers the requests on one connection until it is closed. A
+        request that can't be read gets a 400, and an unexpected error
+        gets a 500; either way the connection is then closed."""
+        try:
+            while True:
+                try:
+                    # readline raises ValueError for a line that is too long
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    method, target, version = request_line.decode(
+                        "latin-1").split()
+                    headers = await read_headers(reader)
+                    length = int(headers.get("content-length", 0))
+                    if not 0 <= length <= MAX_BODY_SIZE:
+                        raise RequestError(
+                            HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            "The request body is too large.")
+                except ValueError:
+                    writer.write(response(
+                        HTTPStatus.BAD_REQUEST,
+                        encode({"error": "Malformed request."}), False))
+                    break
+                except RequestError as error:
+                    writer.write(response(
+                        error.status, encode({"error": str(error)}), False))
+                    break
+                body = await reader.readexactly(length)
+                connection = headers.get("connection", "").lower()
+                keep_alive = (connection != "close"
+                              and (version == "HTTP/1.1"
+                                   or connection == "keep-alive"))
+                try:
+                    status, answer = await self.answer(method, target, body)
+                except RequestError as error:
+                    status, answer = error.status, encode(
+                        {"error": str(error)})
+                self.requests += 1
+                writer.write(response(status, answer, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError):
+            # The client went away part way through
+            pass
+        except Exception as error:
+            print(f"Error answering a request: {error!r}")
+            writer.write(response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                                  encode({"error": "Internal error."}),
+                                  False))
+        finally:
+            writer.close()
+
+    async def watch_scent_data(self):
+        """Swaps in a new snapshot whenever the scent data file changes.
+        The file is read on a worker thread so requests keep being
+        answered."""
+        while True:
+            await asyncio.sleep(RELOAD_POLL_SECONDS)
+            try:
+                reloaded = await asyncio.to_thread(self.watcher.poll)
+                if reloaded is not None:
+                    self.snapshot = self.snapshot.reloaded(*reloaded)
+                    print(f"Reloaded {self.json_path} "
+                          f"(version {self.snapshot.version})")
+            except Exception as error:
+                # Keeps serving the last good snapshot, and keeps watching
+                self.watcher.last_error = error
+                print(f"Could not reload {self.json_path}: {error!r}")
+
+    async def serve(self, host=HOST, port=PORT):
+        """Answers requests until the program is stopped."""
+        server = await asyncio.start_server(self.handle_connection, host,
+                                            port)
+        watch = asyncio.create_task(self.watch_scent_data())
+        print(f"Serving {len(self.snapshot.catalog)} scents on "
+              f"http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watch.cancel()
+
+
+async def read_headers(reader):
+    """Reads a request's header lines into a dictionary with lower case
+    names."""
+    headers = {}
+    for _ in range(MAX_HEADERS):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+        name, separator, value = line.decode("latin-1").partition(":")
+        if not separator:
+            raise ValueError(f"Malformed header line {line!r}")
+        headers[name.strip().lower()] = value.strip()
+    raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                       "Too many header lines.")
+
+
+def main(argv=None):
+    """Reads the command line options and runs the service."""
+    parser = argparse.ArgumentParser(
+        description="Serve blend scores and suggestions over HTTP.")
+    parser.add_argument("--data", default=SCENT_DATA_FILE,
+                        help="scent data file (default: %(default)s)")
+    parser.add_argument("--host", default=HOST,
+                        help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=PORT,
+                        help="port to listen on (default: %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=SCORE_CACHE_SIZE,
+                        help="most scores and suggestions remembered "
+                        "(default: %(default)s)")
+    parser.add_argument("--cache-ttl", type=float,
+                        help="seconds a remembered answer is used for "
+                        "(default: until the scent data is reloaded)")
+    parser.add_argument("--time-budget", type=float,
+                        default=SUGGEST_TIME_BUDGET,
+                        help="most seconds the blend solver searches for "
+                        "one /suggest (default: %(default)s)")
+    parser.add_argument("--memory-limit", type=int,
+                        default=SOLVER_MEMORY_LIMIT // (1024 * 1024),
+                        help="most MB the blend solver's pair table uses "
+                        "(default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        service = BlendService(args.data,
+                               ScoreCache(args.cache_size, args.cache_ttl),
+                               args.time_budget,
+                               args.memory_limit * 1024 * 1024)
+    except (OSError, ValueError, KeyError) as error:
+        sys.exit(f"Could not load {args.data}: {error}")
+    if service.snapshot.palette_index.dangling:
+        print(service.snapshot.palette_index.report())
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
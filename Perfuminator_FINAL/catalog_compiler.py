@@ -0,0 +1,218 @@
+'''
+Compiles scent_data.JSON into a binary catalog that loads without parsing,
+and loads it back with mmap.
+
+Usage: python catalog_compiler.py [scent_data.JSON]
+'''
+
+# Import modules
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from scent_catalog import PaletteIndex, ScentCatalog, parse_scent_data
+
+MAGIC = b"PERFCAT2"
+# magic, source mtime (ns), source size, source SHA-256, scents,
+# attributes, palettes, palette members, attribute value size (bytes)
+HEADER = struct.Struct("<8sQQ32sIIIII")
+# The source mtime and size, which come straight after the magic
+SOURCE_STAMP = struct.Struct("<QQ")
+# Each section starts on a multiple of this many bytes
+ALIGNMENT = 8
+# Row number stored for a palette scent that isn't in the catalog
+MISSING_ROW = -1
+
+
+def binary_path_for(json_path):
+    """The compiled catalog sits next to the JSON file, e.g.
+    scent_data.JSON compiles to scent_data.bin."""
+    return os.path.splitext(json_path)[0] + ".bin"
+
+
+def compile_catalog(json_path, attributes=None, binary_path=None):
+    """Compiles the JSON file, returning the same palettes, catalog and
+    palette index that load_catalog would."""
+    source, source_stat, palettes_data, catalog, palette_index = (
+        read_source(json_path, attributes))
+    write_compiled(binary_path or binary_path_for(json_path), source,
+                   source_stat, palettes_data, catalog)
+    return palettes_data, catalog, palette_index
+
+
+def read_source(json_path, attributes):
+    """Reads and parses the JSON file, keeping its bytes and file details
+    for the compiled catalog's header."""
+    with open(json_path, "rb") as f:
+        source = f.read()
+        source_stat = os.fstat(f.fileno())
+    palettes_data, catalog, palette_index = parse_scent_data(
+        json.loads(source), attributes)[1:]
+    return source, source_stat, palettes_data, catalog, palette_index
+
+
+def write_compiled(binary_path, source, source_stat, palettes_data, catalog):
+    """Writes the compiled catalog. The file layout is the header, then
+    the attribute table (attributes x scents, fixed width), each palette's
+    start in the member table, the member table of catalog rows, each
+    string's start in the string table, and the UTF-8 string table. The
+    strings are the attributes, scent names, palette names and palette
+    member names, in that order."""
+    palette_names = list(palettes_data)
+    members = [name for name in palette_names
+               for name in palettes_data[name]]
+    palette_starts = np.cumsum(
+        [0] + [len(palettes_data[name]) for name in palette_names],
+        dtype="<i4")
+    member_rows = np.array(
+        [catalog.name_index.get(name, MISSING_ROW) for name in members],
+        dtype="<i4")
+    strings = [text.encode("utf-8") for text in (
+        catalog.attributes + catalog.scent_names + palette_names + members)]
+    string_starts = np.cumsum([0] + [len(text) for text in strings],
+                              dtype="<u4")
+    columns = catalog.columns.astype(
+        catalog.columns.dtype.newbyteorder("<"))
+
+    header = HEADER.pack(
+        MAGIC, source_stat.st_mtime_ns, source_stat.st_size,
+        hashlib.sha256(source).digest(), len(catalog),
+        len(catalog.attributes), len(palette_names), len(members),
+        columns.itemsize)
+    # Writes to a temporary file first so a running app never sees a
+    # half written catalog
+    temporary_path = binary_path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        for section in (header, columns.tobytes(), palette_starts.tobytes(),
+                        member_rows.tobytes(), string_starts.tobytes(),
+                        b"".join(strings)):
+            f.write(section)
+            f.write(bytes(-f.tell() % ALIGNMENT))
+    os.replace(temporary_path, binary_path)
+
+
+def read_compiled(binary_path):
+    """Maps a compiled catalog into memory and reads its sections straight
+    from the mapped file, without parsing. The arrays are copied out and
+    the map closed before returning: the tables are small, and on Windows
+    a mapped file can't be replaced, so a map kept open would stop the
+    catalog being compiled again. Returns the header fields, the
+    palettes, the catalog and the palette index, built from the stored
+    palette rows."""
+    with open(binary_path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return read_sections(binary_path, mapped)
+
+
+def read_sections(binary_path, mapped):
+    """Reads the catalog out of a mapped compiled file."""
+    (magic, mtime_ns, size, digest, n_scents, n_attributes, n_palettes,
+     n_members, itemsize) = HEADER.unpack_from(mapped)
+    if magic != MAGIC:
+        raise ValueError(f"'{binary_path}' is not a compiled catalog.")
+
+    offset = HEADER.size + (-HEADER.size % ALIGNMENT)
+
+    def section(dtype, count):
+        nonlocal offset
+        array = np.frombuffer(mapped, dtype=dtype, count=count,
+                              offset=offset).copy()
+        offset += array.nbytes + (-array.nbytes % ALIGNMENT)
+        return array
+
+    columns = section({1: "<i1", 2: "<i2"}[itemsize],
+                      n_attributes * n_scents).reshape(n_attributes, n_scents)
+    palette_starts = section("<i4", n_palettes + 1)
+    member_rows = section("<i4", n_members)
+    n_strings = n_attributes + n_scents + n_palettes + n_members
+    string_starts = section("<u4", n_strings + 1).tolist()
+    blob = mapped[offset:offset + string_starts[-1]]
+    strings = [blob[start:end].decode("utf-8")
+               for start, end in zip(string_starts, string_starts[1:])]
+
+    attributes = strings[:n_attributes]
+    scent_names = strings[n_attributes:n_attributes + n_scents]
+    palette_names = strings[n_attributes + n_scents:
+                            n_attributes + n_scents + n_palettes]
+    members = strings[n_attributes + n_scents + n_palettes:]
+    palettes_data = {}
+    palette_rows = {}
+    for i, name in enumerate(palette_names):
+        start, end = palette_starts[i], palette_starts[i + 1]
+        palettes_data[name] = members[start:end]
+        palette_rows[name] = member_rows[start:end]
+    catalog = ScentCatalog(scent_names, attributes, columns.T)
+    return ((mtime_ns, size, digest), palettes_data, catalog,
+            PaletteIndex(catalog, palettes_data, palette_rows))
+
+
+def is_current(json_path, header, binary_path=None):
+    """Checks a compiled catalog still matches its JSON file. A matching
+    modified time and size is trusted; otherwise the file's hash is
+    compared, so a copied or touched but unchanged file still counts. The
+    compiled catalog at binary_path, if given, then has its header
+    updated to the new time and size, so the next load doesn't hash the
+    file again."""
+    mtime_ns, size, digest = header
+    source_stat = os.stat(json_path)
+    if (source_stat.st_mtime_ns, source_stat.st_size) == (mtime_ns, size):
+        return True
+    with open(json_path, "rb") as f:
+        if hashlib.sha256(f.read()).digest() != digest:
+            return False
+    if binary_path is not None:
+        try:
+            with open(binary_path, "r+b") as f:
+                f.seek(len(MAGIC))
+                f.write(SOURCE_STAMP.pack(source_stat.st_mtime_ns,
+                                          source_stat.st_size))
+        except OSError:
+            # The folder may be read only; it is just hashed again
+            pass
+    return True
+
+
+def load_catalog(json_path, attributes=None):
+    """Loads the palettes, catalog and palette index, from the compiled
+    catalog when it is up to date, otherwise from the JSON file. The JSON
+    is then compiled so the next load is fast. The same errors as reading
+    the JSON file are raised if it can't be loaded. attributes picks which
+    attributes to use; None uses the file's own."""
+    binary_path = binary_path_for(json_path)
+    try:
+        header, palettes_data, catalog, palette_index = read_compiled(
+            binary_path)
+        if ((attributes is None or catalog.attributes == list(attributes))
+                and is_current(json_path, header, binary_path)):
+            return palettes_data, catalog, palette_index
+    except (OSError, ValueError, KeyError, struct.error):
+        # Missing, unreadable or damaged, so it is rebuilt from the JSON
+        pass
+    source, source_stat, palettes_data, catalog, palette_index = (
+        read_source(json_path, attributes))
+    try:
+        write_compiled(binary_path, source, source_stat, palettes_data,
+                       catalog)
+    except OSError:
+        # The folder may be read only; the next load just uses the JSON
+        pass
+    return palettes_data, catalog, palette_index
+
+
+def main(argv=None):
+    """Compiles the JSON file given on the command line."""
+    argv = sys.argv[1:] if argv is None else argv
+    json_path = argv[0] if argv else "scent_data.JSON"
+    catalog, palette_index = compile_catalog(json_path)[1:]
+    if palette_index.dangling:
+        print(palette_index.report())
+    print(f"Compiled {len(catalog)} scents to {binary_path_for(json_path)}")
+
+
+if __name__ == "__main__":
+    main()
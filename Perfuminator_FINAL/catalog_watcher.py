@@ -0,0 +1,92 @@
+'''
+Watches the scent data file for changes, so it can be reloaded while the
+app is running.
+'''
+
+# Import modules
+import os
+import struct
+
+import numpy as np
+
+from catalog_compiler import load_catalog
+
+
+class CatalogWatcher:
+    """This class checks the scent data file's modified time and size,
+    which is cheap enough to do often, and only reloads the file when
+    they change."""
+
+    def __init__(self, json_path, attributes=None):
+        self.json_path = json_path
+        self.attributes = attributes
+        self.last_stat = self.file_stat()
+        # The error from the last reload that failed, if any
+        self.last_error = None
+
+    def file_stat(self):
+        """The file's modified time and size, or None if it is missing."""
+        try:
+            stat = os.stat(self.json_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self):
+        """Returns the new (palettes, catalog, palette index) if the file
+        has changed since the last poll, otherwise None. A file that can't
+        be loaded, such as one that is half saved or has a mistake in it,
+        is reported and skipped until it changes again."""
+        stat = self.file_stat()
+        if stat is None or stat == self.last_stat:
+            return None
+        self.last_stat = stat
+        try:
+            result = load_catalog(self.json_path, self.attributes)
+        except (OSError, ValueError, KeyError, struct.error) as error:
+            # json.JSONDecodeError is a ValueError
+            self.last_error = error
+            print(f"Could not reload {self.json_path}: {error}")
+            return None
+        self.last_error = None
+        return result
+
+
+class CatalogDiff:
+    """What changed between two versions of the scent data: the scents
+    added, removed and with changed attribute values, and the palettes
+    whose list of scents changed."""
+
+    def __init__(self, old_palettes, old_catalog, new_palettes, new_catalog):
+        old_names = set(old_catalog.scent_names)
+        new_names = set(new_catalog.scent_names)
+        self.added = new_names - old_names
+        self.removed = old_names - new_names
+        self.attributes_changed = (old_catalog.attributes
+                                   != new_catalog.attributes)
+
+        # Compares the values of every scent in both versions at once
+        kept = [name for name in new_catalog.scent_names
+                if name in old_names]
+        if self.attributes_changed:
+            self.changed = set(kept)
+        else:
+            different = np.any(
+                old_catalog.matrix[old_catalog.rows(kept)]
+                != new_catalog.matrix[new_catalog.rows(kept)], axis=1)
+            self.changed = {name for name, is_different
+                            in zip(kept, different.tolist()) if is_different}
+
+        self.palettes_changed = {
+            name for name in set(old_palettes) | set(new_palettes)
+            if old_palettes.get(name) != new_palettes.get(name)}
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed
+                    or self.attributes_changed or self.palettes_changed)
+
+    def __repr__(self):
+        return (f"CatalogDiff(added={len(self.added)}, "
+                f"removed={len(self.removed)}, "
+                f"changed={len(self.changed)}, "
+                f"palettes_changed={sorted(self.palettes_changed)})")
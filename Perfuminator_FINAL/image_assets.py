@@ -0,0 +1,78 @@
+'''
+Loads the app's images once and shares them between frames.
+'''
+
+# Import modules
+from collections import OrderedDict
+from fractions import Fraction
+from tkinter import PhotoImage
+
+# Default most memory the cached images may use, in bytes
+MEMORY_BUDGET = 64 * 1024 * 1024
+# Largest zoom or subsample factor used when scaling an image
+MAX_SCALE_FACTOR = 8
+
+
+class ImageAssets:
+    """This class decodes each image once and caches the PhotoImages by
+    (path, size), where size is None for the image as it is or a
+    (width, height) to scale it to. Least recently used images are
+    dropped when the cache goes over its memory budget. A scaled size is
+    made from the cached full size image the first time it is asked for;
+    Tk images can only be made on the Tk thread, so that is where it
+    happens.
+
+    Frames must keep their own reference to any image they show, as
+    Tk blanks an image once its last PhotoImage is deleted."""
+
+    def __init__(self, root, memory_budget=MEMORY_BUDGET):
+        self.root = root
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self.images = OrderedDict()
+
+    def get(self, path, size=None):
+        """Returns the PhotoImage for path, scaled to size if given."""
+        key = (path, size)
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+            return image
+
+        if size is None:
+            image = PhotoImage(master=self.root, file=path)
+        else:
+            image = scale_image(self.get(path), size)
+        self.add(key, image)
+        return image
+
+    def add(self, key, image):
+        """Caches an image, dropping the least recently used ones if the
+        cache is over its budget. The new image is always kept."""
+        self.images[key] = image
+        self.memory_used += image_bytes(image)
+        while self.memory_used > self.memory_budget and len(self.images) > 1:
+            old_image = self.images.popitem(last=False)[1]
+            self.memory_used -= image_bytes(old_image)
+
+
+def scale_image(image, size):
+    """Scales an image to about (width, height) using Tk's whole number
+    zoom and subsample."""
+    width, height = size
+    x_scale = Fraction(width, image.width()).limit_denominator(
+        MAX_SCALE_FACTOR)
+    y_scale = Fraction(height, image.height()).limit_denominator(
+        MAX_SCALE_FACTOR)
+    x_scale = max(x_scale, Fraction(1, MAX_SCALE_FACTOR))
+    y_scale = max(y_scale, Fraction(1, MAX_SCALE_FACTOR))
+    if x_scale.numerator > 1 or y_scale.numerator > 1:
+        image = image.zoom(x_scale.numerator, y_scale.numerator)
+    if x_scale.denominator > 1 or y_scale.denominator > 1:
+        image = image.subsample(x_scale.denominator, y_scale.denominator)
+    return image
+
+
+def image_bytes(image):
+    """Roughly how much memory Tk uses for an image."""
+    return image.width() * image.height() * 4
@@ -0,0 +1,125 @@
+'''
+Keeps every checked out perfume in an SQLite database, written in batches
+by the background writer so saving never holds up the window.
+'''
+
+# Import modules
+import json
+import sqlite3
+import time
+
+# The file the orders are saved in
+ORDER_DATABASE = "orders.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    perfume_name TEXT NOT NULL,
+    scents TEXT NOT NULL,
+    totals TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_perfume_name ON orders (perfume_name);
+CREATE INDEX IF NOT EXISTS orders_created_at ON orders (created_at);
+"""
+INSERT = ("INSERT INTO orders (created_at, perfume_name, scents, totals) "
+          "VALUES (?, ?, ?, ?)")
+
+
+def order_row(perfume_name, blend, created_at=None):
+    """Turns a checked out blend into a row for the orders table. The
+    scents are stored as a JSON list of [name, parts] pairs and the totals
+    as a JSON object."""
+    return (time.time() if created_at is None else created_at,
+            perfume_name,
+            json.dumps([[scent_name, parts] for scent_name, parts
+                        in zip(blend.scent_names, blend.parts)]),
+            json.dumps(blend.profile()))
+
+
+def connect(path):
+    """Opens the database in write-ahead log mode, so reports can read it
+    while orders are being written."""
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # In WAL mode this is still safe from corruption, and only a power cut
+    # can lose the last few commits
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class OrderStore:
+    """This class saves orders through the app's BackgroundWriter. add
+    only queues the order; the writer hands over whatever orders are
+    waiting together, and they are committed in one transaction, so a rush
+    of checkouts costs one disk sync rather than one each."""
+
+    def __init__(self, writer, path=ORDER_DATABASE):
+        self.writer = writer
+        self.path = path
+        # Opened by the writer thread when it saves the first orders
+        self.connection = None
+        # Functions called on the writer thread with each batch of rows,
+        # once they have been committed, and the last error one raised
+        self.listeners = []
+        self.listener_error = None
+        writer.register("orders", self.write_orders)
+
+    def add(self, perfume_name, blend, callback=None, created_at=None):
+        """Queues an order to be saved. callback, if given, is called on
+        the Tk thread with the new order's id, and the error if it
+        couldn't be saved."""
+        self.writer.submit("orders", order_row(perfume_name, blend,
+                                               created_at), callback)
+
+    def write_orders(self, rows):
+        """Runs on the writer thread. Saves a batch of orders in one
+        transaction, returning their ids. The orders are saved once that
+        commits, so an error in a listener is only printed; passing it on
+        would tell the callbacks they failed, and have them saved again."""
+        if self.connection is None:
+            self.connection = connect(self.path)
+        with self.connection:
+            order_ids = [self.connection.execute(INSERT, row).lastrowid
+                         for row in rows]
+        for listener in self.listeners:
+            try:
+                listener(rows)
+            except Exception as error:
+                self.listener_error = error
+                print(f"Could not pass saved orders to {listener!r}: "
+                      f"{error!r}")
+        return order_ids
+
+    def close(self):
+        """Closes the database. The writer must be closed first."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def orders_between(self, start, end):
+        """Returns the (id, time, perfume name, scents, totals) of every
+        order made from start up to end (as Unix times), oldest first."""
+        connection = connect(self.path)
+        try:
+            return [
+                (order_id, created_at, perfume_name, json.loads(scents),
+                 json.loads(totals))
+                for order_id, created_at, perfume_name, scents, totals
+                in connection.execute(
+                    "SELECT id, created_at, perfume_name, scents, totals "
+                    "FROM orders WHERE created_at >= ? AND created_at < ? "
+                    "ORDER BY created_at", (start, end))]
+        finally:
+            connection.close()
+
+    def count_named(self, perfume_name):
+        """How many orders have been made with a perfume name."""
+        connection = connect(self.path)
+        try:
+            return connection.execute(
+                "SELECT COUNT(*) FROM orders WHERE perfume_name = ?",
+                (perfume_name,)).fetchone()[0]
+        finally:
+            connection.close()
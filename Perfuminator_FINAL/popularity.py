@@ -0,0 +1,265 @@
+'''
+Keeps running counts of the most popular scents and 3 scent combinations,
+today and this week, so they can be looked up without reading the orders.
+
+Usage: python popularity.py [orders.db]
+'''
+
+# Import modules
+import datetime
+import hashlib
+import heapq
+import json
+import sys
+import threading
+import time
+from itertools import combinations
+
+import numpy as np
+
+from order_store import ORDER_DATABASE, connect
+
+# How many of the most popular scents and combinations are kept
+TOP_K = 10
+# Number of scents in a combination
+COMBINATION_SIZE = 3
+# Size of the count-min sketch. Each estimate is at most about
+# e / SKETCH_WIDTH of the orders too high, with a chance of about
+# e ** -SKETCH_DEPTH of being worse
+SKETCH_WIDTH = 4096
+SKETCH_DEPTH = 4
+
+
+def day_key(timestamp):
+    """The local date a time falls on."""
+    return datetime.date.fromtimestamp(timestamp)
+
+
+def week_key(timestamp):
+    """The ISO (year, week) a time falls in."""
+    return datetime.date.fromtimestamp(timestamp).isocalendar()[:2]
+
+
+def week_start(timestamp):
+    """The Unix time of midnight on the Monday of a time's week."""
+    date = datetime.date.fromtimestamp(timestamp)
+    monday = date - datetime.timedelta(days=date.weekday())
+    return datetime.datetime.combine(monday, datetime.time.min).timestamp()
+
+
+# The periods counted, each with the function that says which one a time
+# is in
+PERIODS = {"day": day_key, "week": week_key}
+
+
+class CountMinSketch:
+    """This class estimates how many times each key has been added, in a
+    fixed amount of memory however many different keys there are. Every
+    key adds to one counter in each row, picked by a hash, and its
+    estimate is the smallest of its counters, so it can be too high but
+    never too low."""
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.counters = np.zeros((depth, width), dtype=np.int64)
+        self.row_numbers = np.arange(depth)
+
+    def columns(self, key):
+        """The key's counter in each row. blake2b is used rather than
+        hash() so the columns are the same every time the program runs."""
+        digest = hashlib.blake2b(key.encode("utf-8"),
+                                 digest_size=8 * self.depth).digest()
+        return np.frombuffer(digest, dtype="<u8") % self.width
+
+    def add(self, key, count=1):
+        """Counts a key, returning its new estimate."""
+        columns = self.columns(key)
+        self.counters[self.row_numbers, columns] += count
+        return int(self.counters[self.row_numbers, columns].min())
+
+    def estimate(self, key):
+        """How many times a key has been added, or slightly more."""
+        return int(self.counters[self.row_numbers, self.columns(key)].min())
+
+
+class TopK:
+    """This class keeps the k keys with the highest counts, given each
+    key's count as it goes up. The smallest kept count is at the top of a
+    heap, so a new count is checked against it in constant time. Old heap
+    entries for a key whose count has gone up are skipped when they reach
+    the top."""
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.counts = {}
+        self.heap = []
+
+    def update(self, key, count):
+        """Offers a key's latest count."""
+        if key in self.counts:
+            self.counts[key] = count
+        elif len(self.counts) < self.k:
+            self.counts[key] = count
+        else:
+            smallest_count, smallest_key = self.smallest()
+            if count <= smallest_count:
+                return
+            del self.counts[smallest_key]
+            heapq.heappop(self.heap)
+            self.counts[key] = count
+        heapq.heappush(self.heap, (count, key))
+        if len(self.heap) > 4 * self.k:
+            # Clears out the old entries
+            self.heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def smallest(self):
+        """The (count, key) with the smallest count kept."""
+        while self.counts.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0]
+
+    def items(self):
+        """The kept (key, count) pairs, highest count first."""
+        return sorted(self.counts.items(), key=lambda item: (-item[1],
+                                                             item[0]))
+
+
+class PeriodCounts:
+    """The counts for one day or week. Scents are few enough to count
+    exactly; combinations of 3 scents can be far too many, so they are
+    estimated with a count-min sketch."""
+
+    def __init__(self, key, k):
+        self.key = key
+        self.orders = 0
+        self.scent_counts = {}
+        self.top_scents = TopK(k)
+        self.combination_counts = CountMinSketch()
+        self.top_combinations = TopK(k)
+
+    def add_order(self, scent_names):
+        """Counts the scents and combinations in one order."""
+        self.orders += 1
+        scent_names = sorted(set(scent_names))
+        for scent_name in scent_names:
+            count = self.scent_counts.get(scent_name, 0) + 1
+            self.scent_counts[scent_name] = count
+            self.top_scents.update(scent_name, count)
+        for combination in combinations(scent_names, COMBINATION_SIZE):
+            self.top_combinations.update(
+                combination,
+                self.combination_counts.add("\x1f".join(combination)))
+
+
+class Popularity:
+    """This class counts the scents and combinations ordered today and
+    this week as orders are saved. Looking up the most popular ones only
+    reads the kept top k, so it takes the same time however many orders
+    there have been. Orders are counted on the writer thread and looked up
+    from others, so a lock guards the counts."""
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.periods = {}
+        self.lock = threading.Lock()
+
+    def add_order(self, created_at, scent_names):
+        """Counts one order. An order from before the current day or week
+        is only counted in the periods it falls in."""
+        with self.lock:
+            for period, period_key in PERIODS.items():
+                key = period_key(created_at)
+                counts = self.periods.get(period)
+                if counts is None or key > counts.key:
+                    counts = self.periods[period] = PeriodCounts(key, self.k)
+                if key == counts.key:
+                    counts.add_order(scent_names)
+
+    def add_rows(self, rows):
+        """Counts rows just saved to the orders table."""
+        for created_at, perfume_name, scents, totals in rows:
+            self.add_order(created_at, [scent_name for scent_name, parts
+                                        in json.loads(scents)])
+
+    def load(self, path=ORDER_DATABASE, now=None):
+        """Counts every order saved so far this week. Only this week's
+        orders are read, using the index on their time."""
+        now = time.time() if now is None else now
+        connection = connect(path)
+        try:
+            for created_at, scents in connection.execute(
+                    "SELECT created_at, scents FROM orders "
+                    "WHERE created_at >= ? ORDER BY created_at",
+                    (week_start(now),)):
+                self.add_order(created_at, [scent_name for scent_name, parts
+                                            in json.loads(scents)])
+        finally:
+            connection.close()
+
+    def track(self, order_store):
+        """Loads this week's orders, then counts each order the store
+        saves from now on. Both happen on the store's writer thread, in
+        order, so no order is missed or counted twice."""
+        order_store.listeners.append(self.add_rows)
+        order_store.writer.register(
+            "popularity", lambda paths: [self.load(path) for path in paths])
+        order_store.writer.submit("popularity", order_store.path)
+
+    def current(self, period, now=None):
+        """The counts for the current day or week, or None if there have
+        been no orders in it."""
+        counts = self.periods.get(period)
+        now = time.time() if now is None else now
+        if counts is None or counts.key != PERIODS[period](now):
+            return None
+        return counts
+
+    def top_scents(self, period="day", now=None):
+        """The most ordered scents today ("day") or this week ("week"), as
+        (scent name, orders) pairs, most first."""
+        with self.lock:
+            counts = self.current(period, now)
+            return [] if counts is None else counts.top_scents.items()
+
+    def top_combinations(self, period="week", now=None):
+        """The most ordered combinations of 3 scents today or this week,
+        as (scent names, estimated orders) pairs, most first."""
+        with self.lock:
+            counts = self.current(period, now)
+            return [] if counts is None else counts.top_combinations.items()
+
+    def scent_orders(self, scent_name, period="day", now=None):
+        """How many orders today or this week had a scent."""
+        with self.lock:
+            counts = self.current(period, now)
+            return 0 if counts is None else counts.scent_counts.get(
+                scent_name, 0)
+
+    def combination_orders(self, scent_names, period="week", now=None):
+        """About how many orders today or this week had all of 3 scents."""
+        with self.lock:
+            counts = self.current(period, now)
+            if counts is None:
+                return 0
+            return counts.combination_counts.estimate(
+                "\x1f".join(sorted(scent_names)))
+
+
+def main(argv=None):
+    """Prints today's most popular scents and this week's most popular
+    combinations."""
+    argv = sys.argv[1:] if argv is None else argv
+    popularity = Popularity()
+    popularity.load(argv[0] if argv else ORDER_DATABASE)
+    print("Top scents today:")
+    for scent_name, orders in popularity.top_scents("day"):
+        print(f"    {scent_name}: {orders}")
+    print("Top 3 scent combinations this week:")
+    for scent_names, orders in popularity.top_combinations("week"):
+        print(f"    {', '.join(scent_names)}: {orders}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+'''
+A compact, array based catalog of every scent note and its attributes.
+'''
+
+# Import modules
+import json
+
+import numpy as np
+
+# The palette name used for choosing from every scent
+FREE_REIGN = "free_reign"
+
+
+class ScentCatalog:
+    """This class stores the scent notes as one small integer matrix, with
+    a row for each scent and a column for each attribute. Dictionaries map
+    scent names to rows and attribute names to columns, so everything else
+    can work with row numbers and array operations.
+
+    The values are kept column-major: columns holds each attribute's values
+    for every scent one after another, and matrix is the scents x
+    attributes view of the same memory. Filtering or sorting by one
+    attribute then reads a single contiguous column, however many
+    attributes the data has."""
+
+    def __init__(self, scent_names, attributes, matrix):
+        self.scent_names = list(scent_names)
+        self.attributes = list(attributes)
+        self.name_index = {
+            name: row for row, name in enumerate(self.scent_names)}
+        self.attribute_index = {
+            attr: column for column, attr in enumerate(self.attributes)}
+        self.columns = np.ascontiguousarray(matrix.T)
+        self.matrix = self.columns.T
+
+    @classmethod
+    def from_scent_notes(cls, scent_notes_data, attributes):
+        """Builds the catalog from the 'scent_notes' part of the JSON
+        file. Missing attributes count as 0."""
+        scent_names = list(scent_notes_data.keys())
+        # Reads one attribute at a time, straight into its column
+        values = np.array(
+            [[scent_notes_data[name].get(attr, 0) for name in scent_names]
+             for attr in attributes]).reshape(len(attributes),
+                                              len(scent_names)).T
+        if values.size and values.dtype.kind not in "iu":
+            raise ValueError("Scent attribute values must be whole numbers.")
+        return cls(scent_names, attributes, values.astype(
+            smallest_int_type(values)))
+
+    def __len__(self):
+        return len(self.scent_names)
+
+    def __contains__(self, scent_name):
+        return scent_name in self.name_index
+
+    def rows(self, scent_names):
+        """Turns a list of scent names into their matrix rows."""
+        try:
+            return np.array([self.name_index[name] for name in scent_names],
+                            dtype=np.intp)
+        except KeyError as error:
+            raise KeyError(f"Unknown scent note {error.args[0]!r}") from None
+
+    def palette_rows(self, palette):
+        """Finds the rows of the scents in a palette. Returns the rows of
+        the scents that are in the catalog and a list of the names that
+        are not."""
+        rows = np.array([self.name_index.get(name, -1) for name in palette],
+                        dtype=np.intp)
+        found = rows >= 0
+        missing = [name for name, ok in zip(palette, found) if not ok]
+        return rows[found], missing
+
+    def values(self, row):
+        """Returns a dictionary of the attribute values for one row."""
+        return dict(zip(self.attributes, self.matrix[row].tolist()))
+
+    def totals(self, rows, parts=None):
+        """Adds the attribute values of the given rows together, as one
+        vector with a total for each attribute. parts gives how many parts
+        of each scent are in the blend; None means one part of each."""
+        if parts is None:
+            return self.columns[:, rows].sum(axis=1, dtype=np.int32)
+        return self.columns[:, rows].astype(np.int32) @ np.asarray(
+            parts, dtype=np.int32)
+
+    def batch_totals(self, blends, parts=None):
+        """Adds up many blends at once. blends is a 2D array with one
+        blend of rows on each line, and parts, if given, is the same shape
+        with how many parts of each scent are in each blend."""
+        if parts is None:
+            return self.matrix[blends].sum(axis=1, dtype=np.int32)
+        return (self.matrix[blends]
+                * np.asarray(parts, dtype=np.int32)[..., np.newaxis]).sum(
+                    axis=1, dtype=np.int32)
+
+    def filter_rows(self, rows, ranges):
+        """Keeps the rows whose values are inside every range. ranges maps
+        attribute names to (lowest, highest) values, both included. All
+        the attributes are checked in one pass over their columns."""
+        rows = np.asarray(rows, dtype=np.intp)
+        if not ranges:
+            return rows
+        columns = [self.attribute_index[attr] for attr in ranges]
+        lowest, highest = np.array(list(ranges.values())).T[:, :, np.newaxis]
+        values = self.columns[columns][:, rows]
+        return rows[((values >= lowest) & (values <= highest)).all(axis=0)]
+
+    def sort_rows(self, rows, attribute, descending=False):
+        """Orders rows by one attribute's value. Rows with the same value
+        stay in the order they were in."""
+        rows = np.asarray(rows, dtype=np.intp)
+        values = self.columns[self.attribute_index[attribute], rows].astype(
+            np.int32)
+        return rows[np.argsort(-values if descending else values,
+                               kind="stable")]
+
+    def attribute_range(self, attribute):
+        """The lowest and highest value of an attribute over every
+        scent."""
+        column = self.columns[self.attribute_index[attribute]]
+        if not len(column):
+            return 0, 0
+        return int(column.min()), int(column.max())
+
+    @property
+    def nbytes(self):
+        """The memory used by the attribute matrix."""
+        return self.matrix.nbytes
+
+
+class PaletteIndex:
+    """Every palette's scents as an array of catalog rows, worked out and
+    checked once when the data is loaded, so starting a palette is just a
+    dictionary lookup. Scents a palette lists that aren't in the catalog
+    are left out, and recorded in dangling by palette name."""
+
+    def __init__(self, catalog, palettes_data, member_rows=None):
+        self.rows = {}
+        self.dangling = {}
+        for name, members in palettes_data.items():
+            if member_rows is None:
+                rows, missing = catalog.palette_rows(members)
+            else:
+                # Rows already looked up, e.g. by the compiled catalog,
+                # with -1 for the missing scents
+                rows = np.asarray(member_rows[name], dtype=np.intp)
+                found = rows >= 0
+                missing = [member for member, ok
+                           in zip(members, found.tolist()) if not ok]
+                rows = rows[found]
+            self.rows[name] = rows
+            if missing:
+                self.dangling[name] = missing
+        self.all_rows = np.arange(len(catalog))
+
+    def palette(self, palette_type):
+        """The catalog rows of a palette's scents. Free reign has every
+        scent, and an unknown palette has none."""
+        if palette_type == FREE_REIGN:
+            return self.all_rows
+        return self.rows.get(palette_type, self.all_rows[:0])
+
+    def report(self):
+        """Describes every missing scent in one message, or returns an
+        empty string if there are none."""
+        return "\n".join(
+            f"The '{name}' palette lists scents that aren't in the scent "
+            f"notes: {', '.join(missing)}."
+            for name, missing in self.dangling.items())
+
+
+def smallest_int_type(values):
+    """Picks int8 if all the values fit, otherwise int16."""
+    if values.size == 0 or (values.min() >= -128 and values.max() <= 127):
+        return np.int8
+    if values.min() >= -32768 and values.max() <= 32767:
+        return np.int16
+    raise ValueError("Scent attribute values must fit in 16 bits.")
+
+
+def attribute_schema(data):
+    """The attributes the scents are rated on. The file can list them
+    under 'attributes'; otherwise they are every attribute any scent has,
+    in the order they first appear."""
+    if "attributes" in data:
+        attributes = data["attributes"]
+        if (not isinstance(attributes, list)
+                or not all(isinstance(attr, str) for attr in attributes)):
+            raise ValueError("'attributes' must be a list of names.")
+        return list(attributes)
+    # A dictionary keeps the order the attributes are first seen in
+    return list(dict.fromkeys(
+        attr for values in data["scent_notes"].values() for attr in values))
+
+
+def load_scent_file(filename, attributes=None):
+    """Reads the scent data JSON file. Returns the scent notes and palettes
+    dictionaries, the catalog built from the scent notes and the palette
+    index. attributes picks which attributes to use; None uses the file's
+    own."""
+    with open(filename, 'r') as f:
+        data = json.load(f)
+    return parse_scent_data(data, attributes)
+
+
+def parse_scent_data(data, attributes=None):
+    """Checks the parsed JSON data. Returns the scent notes and palettes
+    dictionaries, the catalog built from the scent notes and the palette
+    index. attributes picks which attributes to use; None uses the file's
+    own."""
+    # Checks if the necessary keys are found in the file
+    if (not isinstance(data, dict) or "scent_notes" not in data
+            or "palettes" not in data):
+        raise ValueError(
+            "JSON data file is missing required 'scent_notes' "
+            "or 'palettes' keys.")
+
+    # Checks the shape of the data, so a mistake in the file is reported
+    # rather than failing part way through building the catalog
+    scent_notes_data = data["scent_notes"]
+    palettes_data = data["palettes"]
+    if not isinstance(scent_notes_data, dict):
+        raise ValueError("'scent_notes' must map scent names to their "
+                         "attributes.")
+    for name, values in scent_notes_data.items():
+        if not isinstance(values, dict):
+            raise ValueError(f"Scent note '{name}' must map attribute "
+                             "names to values.")
+        if not all(type(value) is int for value in values.values()):
+            raise ValueError(f"Scent note '{name}' has an attribute value "
+                             "that isn't a whole number.")
+    if not isinstance(palettes_data, dict):
+        raise ValueError("'palettes' must map palette names to lists of "
+                         "scents.")
+    for name, members in palettes_data.items():
+        if (not isinstance(members, list)
+                or not all(isinstance(member, str) for member in members)):
+            raise ValueError(f"Palette '{name}' must be a list of scent "
+                             "names.")
+    if attributes is None:
+        attributes = attribute_schema(data)
+    catalog = ScentCatalog.from_scent_notes(scent_notes_data, attributes)
+    return (scent_notes_data, palettes_data, catalog,
+            PaletteIndex(catalog, palettes_data))
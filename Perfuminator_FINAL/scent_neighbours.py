@@ -0,0 +1,155 @@
+'''
+Finds the scents most similar to each scent, by how close their attribute
+values are.
+'''
+
+# Import modules
+import numpy as np
+
+# Similar scents kept for each scent
+NEIGHBOURS = 5
+# Most memory a block of distances may use while the table is built, in
+# bytes
+MEMORY_LIMIT = 64 * 1024 * 1024
+# Row number stored when a scent has fewer than NEIGHBOURS other scents
+NO_NEIGHBOUR = -1
+
+
+class NeighbourTable:
+    """This class stores, for every scent, the rows of the k other scents
+    whose attribute values are closest (by squared distance), nearest
+    first. The table is worked out when the data is loaded, so finding a
+    scent's similar scents is just reading its row. Scents the same
+    distance away are ordered by their row in the catalog."""
+
+    def __init__(self, catalog, neighbours, distances):
+        self.catalog = catalog
+        self.neighbours = neighbours
+        self.distances = distances
+
+    @classmethod
+    def build(cls, catalog, k=NEIGHBOURS, memory_limit=MEMORY_LIMIT):
+        """Works out the table for every scent in the catalog."""
+        all_rows = np.arange(len(catalog))
+        neighbours, distances = nearest(catalog, all_rows, all_rows, k,
+                                        memory_limit)
+        return cls(catalog, neighbours, distances)
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    def similar(self, row):
+        """The rows of the scents most similar to the scent at row,
+        nearest first."""
+        neighbours = self.neighbours[row]
+        return neighbours[neighbours != NO_NEIGHBOUR]
+
+    def similar_names(self, scent_name):
+        """The names of the scents most similar to a scent."""
+        names = self.catalog.scent_names
+        return [names[row] for row in self.similar(
+            self.catalog.name_index[scent_name]).tolist()]
+
+    def updated(self, catalog, diff, memory_limit=MEMORY_LIMIT):
+        """Returns the table for a reloaded catalog, where diff is the
+        CatalogDiff from this table's catalog. Only scents that were added
+        or changed, or that lost one of their similar scents, are compared
+        with every scent again. The rest only need comparing with the
+        added and changed scents.
+
+        If the scents that are kept come in a different order, the whole
+        table is built again: a scent tied with the last of another
+        scent's similar scents may now come before it, and the old table
+        doesn't say which scents were tied."""
+        if diff.attributes_changed:
+            return NeighbourTable.build(catalog, self.k, memory_limit)
+        n = len(catalog)
+        k = self.k
+        # Each old row's new row, or NO_NEIGHBOUR if it was removed or its
+        # values changed, as its old distances are then wrong
+        old_to_new = np.array(
+            [NO_NEIGHBOUR if name in diff.changed
+             else catalog.name_index.get(name, NO_NEIGHBOUR)
+             for name in self.catalog.scent_names] + [NO_NEIGHBOUR],
+            dtype=np.intp)
+        fresh_rows = np.sort(catalog.rows(diff.added | diff.changed))
+        kept_old_rows = np.flatnonzero(old_to_new[:-1] != NO_NEIGHBOUR)
+        if np.any(np.diff(old_to_new[kept_old_rows]) < 0):
+            return NeighbourTable.build(catalog, k, memory_limit)
+        # A padding NO_NEIGHBOUR (-1) indexes the extra NO_NEIGHBOUR
+        old_neighbours = old_to_new[self.neighbours[kept_old_rows]]
+        lost = np.any((old_neighbours == NO_NEIGHBOUR)
+                      & (self.neighbours[kept_old_rows] != NO_NEIGHBOUR),
+                      axis=1)
+
+        neighbours = np.full((n, k), NO_NEIGHBOUR, dtype=np.intp)
+        distances = np.full((n, k), np.iinfo(np.int32).max, dtype=np.int32)
+        all_rows = np.arange(n)
+        redo_rows = np.union1d(fresh_rows, old_to_new[kept_old_rows[lost]])
+        neighbours[redo_rows], distances[redo_rows] = nearest(
+            catalog, redo_rows, all_rows, k, memory_limit)
+
+        # The other scents keep their old similar scents, unless an added
+        # or changed scent is now closer
+        keep = ~lost
+        rows = old_to_new[kept_old_rows[keep]]
+        new_neighbours, new_distances = nearest(
+            catalog, rows, fresh_rows, k, memory_limit)
+        candidates = np.concatenate([old_neighbours[keep], new_neighbours],
+                                    axis=1)
+        candidate_distances = np.concatenate(
+            [self.distances[kept_old_rows[keep]], new_distances], axis=1)
+        order = np.argsort(sort_keys(candidate_distances, candidates, n),
+                           axis=1, kind="stable")[:, :k]
+        neighbours[rows] = np.take_along_axis(candidates, order, axis=1)
+        distances[rows] = np.take_along_axis(candidate_distances, order,
+                                             axis=1)
+        return NeighbourTable(catalog, neighbours, distances)
+
+
+def nearest(catalog, query_rows, candidate_rows, k, memory_limit=MEMORY_LIMIT):
+    """For each query row, finds the k candidate rows (other than itself)
+    closest to it. Returns arrays of their rows and squared distances,
+    padded with NO_NEIGHBOUR when there aren't k candidates. The distances
+    are worked out in blocks of query rows that fit in memory_limit."""
+    query_rows = np.asarray(query_rows, dtype=np.intp)
+    candidate_rows = np.asarray(candidate_rows, dtype=np.intp)
+    n = len(catalog)
+    neighbours = np.full((len(query_rows), k), NO_NEIGHBOUR, dtype=np.intp)
+    distances = np.full((len(query_rows), k), np.iinfo(np.int32).max,
+                        dtype=np.int32)
+    if not len(query_rows) or not len(candidate_rows) or not k:
+        return neighbours, distances
+
+    # Small whole numbers, so float64 distances are exact and use BLAS
+    candidates = catalog.matrix[candidate_rows].astype(np.float64)
+    candidate_norms = np.einsum("ij,ij->i", candidates, candidates)
+    width = min(k, len(candidate_rows))
+    block_size = max(1, memory_limit // (len(candidate_rows) * 8 * 3))
+    for start in range(0, len(query_rows), block_size):
+        rows = query_rows[start:start + block_size]
+        queries = catalog.matrix[rows].astype(np.float64)
+        squared = (np.einsum("ij,ij->i", queries, queries)[:, np.newaxis]
+                   + candidate_norms - 2 * queries @ candidates.T)
+        keys = sort_keys(squared, candidate_rows, n)
+        keys[rows[:, np.newaxis] == candidate_rows] = np.inf
+        best = np.argpartition(keys, width - 1, axis=1)[:, :width]
+        best = np.take_along_axis(
+            best, np.argsort(np.take_along_axis(keys, best, axis=1),
+                             axis=1), axis=1)
+        found = np.isfinite(np.take_along_axis(keys, best, axis=1))
+        block = slice(start, start + len(rows))
+        neighbours[block, :width] = np.where(found, candidate_rows[best],
+                                             NO_NEIGHBOUR)
+        distances[block, :width] = np.where(
+            found, np.take_along_axis(squared, best, axis=1),
+            np.iinfo(np.int32).max)
+    return neighbours, distances
+
+
+def sort_keys(distances, rows, n):
+    """Orders candidates by distance, then by row, as one float64 key.
+    Missing neighbours sort last."""
+    return np.where(rows == NO_NEIGHBOUR, np.inf,
+                    distances.astype(np.float64) * n + rows)
@@ -0,0 +1,67 @@
+'''
+Finds scents by any part of their name, fast enough to search on every
+key press.
+'''
+
+# Import modules
+from collections import defaultdict
+
+import numpy as np
+
+# Length of the name pieces indexed
+GRAM_SIZE = 3
+
+
+class ScentSearch:
+    """This class indexes every 3 letter piece (trigram) of the scent
+    names, ignoring case, so a search only looks at names that have all of
+    the query's trigrams rather than at every name. Shorter queries, which
+    match too many names for an index to help, are checked against the
+    names directly."""
+
+    def __init__(self, scent_names):
+        self.names = np.array([name.casefold() for name in scent_names],
+                              dtype=str)
+        postings = defaultdict(list)
+        for row, name in enumerate(self.names.tolist()):
+            for gram in {name[i:i + GRAM_SIZE]
+                         for i in range(len(name) - GRAM_SIZE + 1)}:
+                postings[gram].append(row)
+        # The rows of the names with each trigram, in ascending order
+        self.postings = {gram: np.array(rows, dtype=np.intp)
+                         for gram, rows in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query, within=None):
+        """Returns the rows of the names that contain query. within limits
+        the search to those rows, and the result keeps their order; it is
+        how a longer query narrows the results of a shorter one instead of
+        searching every name again."""
+        query = query.casefold()
+        grams = sorted({query[i:i + GRAM_SIZE]
+                        for i in range(len(query) - GRAM_SIZE + 1)})
+        if any(gram not in self.postings for gram in grams):
+            return np.empty(0, dtype=np.intp)
+        # The rarest trigrams first, so the candidates shrink fastest
+        grams.sort(key=lambda gram: len(self.postings[gram]))
+        if within is not None:
+            candidates = np.asarray(within, dtype=np.intp)
+        elif grams:
+            candidates = self.postings[grams.pop(0)]
+        else:
+            candidates = np.arange(len(self.names))
+        if not query:
+            return candidates
+        for gram in grams:
+            candidates = candidates[np.isin(candidates, self.postings[gram],
+                                            kind="sort")]
+            if not len(candidates):
+                return candidates
+        if len(query) == GRAM_SIZE:
+            # A name with the query's only trigram contains the query
+            return candidates
+        # Having every trigram doesn't mean they are next to each other,
+        # so the remaining names are checked
+        return candidates[np.char.find(self.names[candidates], query) >= 0]
@@ -0,0 +1,92 @@
+'''
+Remembers recently worked out blend scores, as the same popular blends are
+scored again and again.
+'''
+
+# Import modules
+import time
+from collections import OrderedDict
+
+# Most answers kept
+SCORE_CACHE_SIZE = 4096
+# How long an answer is kept, in seconds, or None to keep it until it is
+# pushed out or the scent data is reloaded
+SCORE_CACHE_TTL = None
+
+
+def blend_key(scent_names, parts=None):
+    """The blend's (scent name, parts) pairs in name order, so the same
+    blend gives the same key whatever order its scents were chosen in.
+    None for parts means one part of each, the same as listing them."""
+    if parts is None:
+        parts = [1] * len(scent_names)
+    return tuple(sorted(zip(scent_names, parts)))
+
+
+class ScoreCache:
+    """This class keeps the answers for the most recently used keys, up to
+    max_size of them, dropping the least recently used first. An answer
+    older than ttl seconds is worked out again. Keys start with the
+    version of the scent data they were worked out from, and invalidate
+    empties the cache when it is reloaded, so an old answer is never
+    given. hits and misses count how often an answer was found.
+
+    It is only used from one thread at a time: the Tk thread in the game,
+    and the event loop in the blend service."""
+
+    def __init__(self, max_size=SCORE_CACHE_SIZE, ttl=SCORE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # Each key's (time it runs out, answer), least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, work_out):
+        """Returns the answer kept for key, or calls work_out() to get it
+        and keeps that."""
+        answer = self.lookup(key)
+        if answer is None:
+            answer = work_out()
+            self.store(key, answer)
+        return answer
+
+    def lookup(self, key):
+        """Returns the answer kept for key, or None if there isn't one, for
+        answers that are worked out somewhere else, e.g. on another thread,
+        and then given to store."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires, answer = entry
+            if expires is None or time.monotonic() < expires:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return answer
+        self.misses += 1
+        return None
+
+    def store(self, key, answer):
+        """Keeps an answer, dropping the least recently used ones if there
+        are too many."""
+        self.entries[key] = (None if self.ttl is None
+                             else time.monotonic() + self.ttl, answer)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self):
+        """Forgets every answer, e.g. when the scent data is reloaded."""
+        self.entries.clear()
+
+    def stats(self):
+        """The cache's size and how often answers were found in it."""
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,36 @@
+'''
+Records how the app is used and how fast it runs, as JSON lines.
+'''
+
+# Import modules
+import json
+import time
+
+# The file the telemetry events are added to
+TELEMETRY_FILE = "telemetry.jsonl"
+
+
+class Telemetry:
+    """This class records events, such as how long the window took to
+    appear, through the app's BackgroundWriter. Telemetry is dropped
+    rather than waited for when the writer is behind, so it can never slow
+    down saving orders."""
+
+    def __init__(self, writer, path=TELEMETRY_FILE):
+        self.writer = writer
+        self.path = path
+        writer.register("telemetry", self.write_events)
+
+    def record(self, event, **fields):
+        """Queues an event with the time it happened and any other
+        details."""
+        self.writer.submit(
+            "telemetry", json.dumps({"event": event, "time": time.time(),
+                                     **fields}), droppable=True)
+
+    def write_events(self, lines):
+        """Runs on the writer thread. Adds a batch of events to the file
+        in one write."""
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        return [None] * len(lines)